@@ -1,18 +1,174 @@
+import io
+import sqlite3
 import streamlit as st
 import db
-from datetime import datetime
+import profiler
+import transfer
+from datetime import date, datetime, timedelta
 
 st.set_page_config(page_title="Hospital System", layout="wide")
 
 # Top-level page selector
-page = st.sidebar.radio("Page", ["Home", "Manage"])
+page = st.sidebar.radio("Page", ["Home", "Calendar", "Manage", "Import", "Admin"])
+
+
+class RenderData:
+    """Per-run memo of db reads, shared by every tab and expander.
+
+    The script re-executes top to bottom on each rerun, so a fresh instance
+    is created per run and each dataset is fetched at most once.
+    """
+
+    def __init__(self):
+        self._memo = {}
+        self.fetches = 0
+
+    def get(self, fn, *args, **kwargs):
+        key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+        if key not in self._memo:
+            self.fetches += 1
+            self._memo[key] = fn(*args, **kwargs)
+        return self._memo[key]
+
+    @property
+    def doctors(self):
+        return self.get(db.list_doctors)
+
+    @property
+    def departments(self):
+        return self.get(db.list_departments)
+
+
+# Pool, snapshot and cache bookkeeping is called around every statement; tracing it is noise.
+profiler.instrument(db, exclude=(
+    "get_pool", "close_pool", "get_snapshot", "table_versions", "archive_path",
+    "query_count", "reset_query_count", "ensure_schema",
+))
+profiler.reset_run()
+db.reset_query_count()
+# Migrates the database on the first run in this process; a no-op afterwards.
+db.ensure_schema()
+data = RenderData()
+
+
+def paged(key, fetch, **filters):
+    """Fetch and return only the current page of a keyset-paginated db call.
+
+    The stack of cursors lives in session_state so Previous/Next survive
+    reruns; changing the filters starts again from the first page.
+    """
+    state = st.session_state.setdefault(key, {"filters": filters, "cursors": [None]})
+    if state["filters"] != filters:
+        state.update(filters=filters, cursors=[None])
+    cursors = state["cursors"]
+    rows, next_cursor = fetch(after=cursors[-1], **filters)
+    col_prev, col_page, col_next = st.columns([1, 4, 1])
+    if col_prev.button("Previous", key=f"{key}_prev", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    col_page.caption(f"Page {len(cursors)}")
+    if col_next.button("Next", key=f"{key}_next", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
+    return rows
+
+
+def end_of(start, minutes):
+    return (datetime.fromisoformat(start) + timedelta(minutes=int(minutes))).isoformat(timespec="seconds")
+
+
+def duration_of(appt):
+    """Length of an existing appointment in minutes (the default if unknown)."""
+    try:
+        delta = datetime.fromisoformat(appt['end_time']) - datetime.fromisoformat(appt['start_time'])
+    except (TypeError, ValueError):
+        return db.DEFAULT_DURATION_MIN
+    return max(5, int(delta.total_seconds() // 60))
+
+
+def book(action, doctor_id, department_id, patient_id, start, duration):
+    """Run an add/update call, turning scheduling errors into messages with alternatives.
+
+    The alternatives offered are free for the full `duration` (minutes).
+    """
+    try:
+        return action()
+    except db.SchedulingConflict as exc:
+        st.error(str(exc))
+        if doctor_id or department_id:
+            slots = db.next_free_slots(
+                doctor_id=doctor_id,
+                department_id=None if doctor_id else department_id,
+                after=start,
+                duration_min=int(duration),
+                patient_id=patient_id,
+            )
+            if slots:
+                st.info("Next free slots: " + ", ".join(f"{s['start_time']} (doctor {s['doctor_id']})" for s in slots))
+    except ValueError as exc:
+        st.error(str(exc))
+    return None
+
+
+def patient_label(p):
+    return f"{p['id']}: {p['first_name']} {p['last_name']}"
+
+
+def doctor_label(d):
+    return f"{d['id']}: Dr. {d['first_name']} {d['last_name']}"
+
+
+def search_picker(label, search, fmt, key, current=None):
+    """Type-ahead picker: a search box and a selectbox of the best matches.
+
+    Only the top db.SEARCH_LIMIT matches are fetched, never the whole table.
+    `current` (a row) is kept as an option so an existing value can stay
+    selected without searching. Returns the chosen id or None.
+    """
+    query = st.text_input(f"Search {label.lower()}", key=f"{key}_q", placeholder="name, email or phone")
+    rows = search(query) if query.strip() else []
+    if current and all(r['id'] != current['id'] for r in rows):
+        rows = [current] + rows
+    options = {r['id']: fmt(r) for r in rows}
+    ids = [None] + list(options)
+    return st.selectbox(
+        label, ids, index=ids.index(current['id']) if current else 0,
+        format_func=lambda i: "" if i is None else options[i], key=f"{key}_sel",
+    )
+
+
+def dashboard():
+    """Headline metrics and charts, read from the precomputed stats tables."""
+    try:
+        totals = db.stats_totals()
+        per_day = db.appointments_per_day()
+        by_department = db.appointments_by_department()
+        by_doctor = db.appointments_by_doctor()
+    except sqlite3.OperationalError:
+        st.info("Dashboard tables are missing; the schema migration has not run on this database.")
+        return
+    cols = st.columns(5)
+    for col, name in zip(cols, ("patients", "appointments", "scheduled", "completed", "cancelled")):
+        col.metric(name.capitalize(), f"{totals.get(name, 0):,}")
+    st.subheader(f"Appointments per day (last {db.STATS_DAYS} days)")
+    st.bar_chart(per_day, x="day", y="appointments", color="status")
+    col_dep, col_doc = st.columns(2)
+    col_dep.subheader("By department")
+    col_dep.bar_chart(by_department, x="department", y="appointments", color="status")
+    col_doc.subheader("Busiest doctors")
+    col_doc.bar_chart(by_doctor, x="doctor", y="appointments", color="status")
 
 
 def home_page():
     st.title("Hospital System")
-    if st.button("Init DB (create tables)"):
-        db.init_db()
-        st.success("Database initialized (schema applied).")
+    if st.button("Load sample data"):
+        if db.init_db():
+            st.success("Sample data added.")
+        else:
+            st.info("The database already has patients; no sample data added.")
+
+    st.header("Dashboard")
+    dashboard()
 
     with st.sidebar.expander("Quick add"):
         st.subheader("Add patient")
@@ -26,7 +182,7 @@ def home_page():
                 st.error("Provide first and last name")
 
     st.header("Patients")
-    patients = db.list_patients()
+    patients = paged("home_patients", db.list_patients_page)
     if patients:
         for p in patients:
             st.write(f"{p['id']}: {p['first_name']} {p['last_name']} — {p.get('dob')} — {p.get('email')}")
@@ -35,41 +191,28 @@ def home_page():
 
     # Show doctors
     st.header("Doctors")
-    doctors = db.list_doctors()
+    doctors = data.doctors
     if doctors:
         for d in doctors:
             st.write(f"{d['id']}: Dr. {d['first_name']} {d['last_name']} — {d.get('department_name')} — {d.get('email')}")
     else:
         st.info("No doctors yet. Add one from Manage -> Doctors")
 
-    # Schedule appointment form
+    # Schedule appointment form; the pickers sit outside the form so
+    # typing a search reruns immediately instead of waiting for submit.
     st.header("Schedule Appointment")
-    patients = db.list_patients()
-    doctors = db.list_doctors()
-    dept_list = db.list_departments()
+    dept_list = data.departments
+    pid = search_picker("Patient", db.search_patients, patient_label, "home_pat")
+    doc_id = search_picker("Doctor (optional)", db.search_doctors, doctor_label, "home_doc")
 
     with st.form("schedule_appointment"):
-        if patients:
-            patient_options = {f"{p['id']}: {p['first_name']} {p['last_name']}": p['id'] for p in patients}
-            patient_label = st.selectbox("Patient", list(patient_options.keys()))
-            pid = patient_options[patient_label]
-        else:
-            st.warning("Create a patient first.")
-            pid = None
-
-        if doctors:
-            doctor_options = {f"{d['id']}: Dr. {d['first_name']} {d['last_name']}": d['id'] for d in doctors}
-            doctor_label = st.selectbox("Doctor (optional)", [""] + list(doctor_options.keys()))
-            doc_id = doctor_options[doctor_label] if doctor_label and doctor_label != "" else None
-        else:
-            doc_id = None
-
         dept_opts = {f"{d['id']}: {d['name']}": d['id'] for d in dept_list}
         dept_label = st.selectbox("Department (optional)", [""] + list(dept_opts.keys()))
         dept_id = dept_opts[dept_label] if dept_label and dept_label != "" else None
 
         start_date = st.date_input("Start date")
         start_time = st.time_input("Start time")
+        duration = st.number_input("Duration (minutes)", min_value=5, max_value=db.MAX_DURATION_MIN, value=db.DEFAULT_DURATION_MIN, step=5)
         reason = st.text_input("Reason")
         submit_appt = st.form_submit_button("Schedule")
         if submit_appt:
@@ -77,207 +220,442 @@ def home_page():
                 st.error("No patient selected.")
             else:
                 dt_start = datetime.combine(start_date, start_time).isoformat()
-                aid = db.add_appointment(pid, doc_id, dept_id, dt_start, None, reason or None)
-                st.success(f"Appointment scheduled (id={aid})")
+                aid = book(
+                    lambda: db.add_appointment(pid, doc_id, dept_id, dt_start, end_of(dt_start, duration), reason or None),
+                    doc_id, dept_id, pid, dt_start, duration,
+                )
+                if aid:
+                    st.success(f"Appointment scheduled (id={aid})")
 
     st.header("Appointments")
-    appts = db.list_appointments()
-    if appts:
+    appts = paged("home_appointments", db.appointments_frame)
+    if not appts.empty:
         # Render as table for compact view
-        rows = []
-        for a in appts:
-            rows.append({
-                "id": a["id"],
-                "patient": f"{a['patient_first']} {a['patient_last']}",
-                "doctor": (f"Dr. {a['doctor_first']} {a['doctor_last']}" if a.get('doctor_first') else "(none)"),
-                "department": a.get('department_name') or '(none)',
-                "start_time": a['start_time'],
-                "status": a['status'],
-                "reason": a.get('reason') or "",
-            })
-        st.table(rows)
+        st.table(appts.set_index("id"))
     else:
         st.info("No appointments yet.")
 
 
-def manage_page():
-    st.title("Manage — Hospital Data")
-    tabs = st.tabs(["Patients", "Doctors", "Departments", "Appointments"])  # 4 tabs
+CALENDAR_OWNERS = ("Doctor", "Department", "Patient")
+DAY_COLUMNS = ("start_time", "end_time", "patient_first", "patient_last", "doctor_first", "doctor_last", "department_name", "status", "reason")
+
+
+def calendar_window(day, view):
+    """[start, end) of the day, or the Monday-to-Sunday week, containing `day`."""
+    first = day if view == "Day" else day - timedelta(days=day.weekday())
+    start = datetime.combine(first, datetime.min.time())
+    return start, start + timedelta(days=1 if view == "Day" else 7)
+
+
+def shift_calendar(days):
+    st.session_state.cal_day = date.today() if days is None else st.session_state.cal_day + timedelta(days=days)
+
+
+def calendar_entry(a, owner):
+    """One line per appointment, naming the people the calendar is not already for."""
+    doctor = f"Dr. {a.doctor_first} {a.doctor_last}" if a.doctor_first else (a.department_name or "(no doctor)")
+    patient = f"{a.patient_first} {a.patient_last}"
+    who = {"Doctor": patient, "Department": f"{patient} · {doctor}", "Patient": doctor}[owner]
+    return f"{a.start_time[11:16]}–{(a.end_time or '')[11:16]} {who} ({a.status})"
+
+
+def calendar_page():
+    st.title("Calendar")
+    col_owner, col_pick = st.columns([1, 3])
+    owner = col_owner.radio("Schedule of", CALENDAR_OWNERS, key="cal_owner")
+    with col_pick:
+        if owner == "Doctor":
+            owner_id = search_picker("Doctor", db.search_doctors, doctor_label, "cal_doc")
+        elif owner == "Patient":
+            owner_id = search_picker("Patient", db.search_patients, patient_label, "cal_pat")
+        else:
+            deps = department_options()
+            owner_id = deps.get(st.selectbox("Department", [""] + list(deps), key="cal_dep"))
+    if not owner_id:
+        st.info(f"Choose a {owner.lower()} to see the schedule.")
+        return
+    schedule(owner, owner_id)
+
+
+@st.fragment
+def schedule(owner, owner_id):
+    """Day or week grid; moving it reruns only this fragment and loads only the visible window."""
+    st.session_state.setdefault("cal_day", date.today())
+    col_view, col_prev, col_today, col_next, col_day, col_history = st.columns([2, 1, 1, 1, 2, 2])
+    view = col_view.radio("View", ("Week", "Day"), horizontal=True, key="cal_view")
+    step = 7 if view == "Week" else 1
+    col_prev.button("Previous", key="cal_prev", on_click=shift_calendar, args=(-step,))
+    col_today.button("Today", key="cal_today", on_click=shift_calendar, args=(None,))
+    col_next.button("Next", key="cal_next", on_click=shift_calendar, args=(step,))
+    col_day.date_input("Date", key="cal_day")
+    history = col_history.checkbox("Include history", key="cal_history")
+
+    start, end = calendar_window(st.session_state.cal_day, view)
+    appts = db.appointments_between(start.isoformat(), end.isoformat(), include_history=history, **{f"{owner.lower()}_id": owner_id})
+    st.caption(f"{len(appts)} appointments, {start:%a %d %b} – {end - timedelta(days=1):%a %d %b %Y}")
+    if view == "Day":
+        if appts:
+            st.dataframe([a.as_dict() for a in appts], hide_index=True, column_order=DAY_COLUMNS)
+        else:
+            st.info("Nothing booked.")
+        return
+    # Appointments that began before the window are shown on its first day.
+    by_day = {}
+    for a in appts:
+        by_day.setdefault(max(a.start_time[:10], start.date().isoformat()), []).append(a)
+    for offset, col in enumerate(st.columns(7)):
+        day = (start + timedelta(days=offset)).date()
+        col.markdown(f"**{day:%a %d %b}**")
+        col.markdown("  \n".join(calendar_entry(a, owner) for a in by_day.get(day.isoformat(), ())) or "—")
+
+
+def export_controls(names, key):
+    """Build an export in memory on request, then offer it for download.
+
+    The export only runs when "Prepare export" is clicked, not on every
+    rerun. The download button needs the whole file in memory anyway, so
+    it is written to a buffer and nothing is left on disk.
+    """
+    with st.expander("Export"):
+        name = st.selectbox("Dataset", names, key=f"{key}_name") if len(names) > 1 else names[0]
+        fmt = st.radio("Format", transfer.EXPORT_FORMATS, horizontal=True, key=f"{key}_fmt")
+        if st.button("Prepare export", key=f"{key}_prep"):
+            st.session_state.pop(f"{key}_file", None)
+            buf = io.BytesIO()
+            rows = transfer.export_file(name, fmt, buf)
+            st.session_state[f"{key}_file"] = (buf.getvalue(), name, fmt, rows)
+        ready = st.session_state.get(f"{key}_file")
+        if ready and ready[1:3] == (name, fmt):
+            data, _, _, rows = ready
+            st.download_button(f"Download {rows:,} rows", data, file_name=f"{name}.{fmt}", key=f"{key}_dl")
+
 
-    # Patients tab
-    with tabs[0]:
-        st.header("Patients")
-        patients = db.list_patients()
-        st.dataframe(patients)
+GENDERS = ["", "Male", "Female", "Other"]
 
-        with st.expander("Add patient"):
+
+def manage_patients():
+    st.header("Patients")
+    name_filter = st.text_input("Filter by name", key="m_patient_filter")
+    st.dataframe(paged("manage_patients", db.patients_frame, name=name_filter or None), hide_index=True)
+    export_controls(["patients"], "exp_patients")
+
+    with st.expander("Add patient"):
+        with st.form("m_add_patient", clear_on_submit=True):
             fn = st.text_input("First name", key="m_fn")
             ln = st.text_input("Last name", key="m_ln")
             dob = st.text_input("DOB (YYYY-MM-DD)", key="m_dob")
-            gender = st.selectbox("Gender", ["", "Male", "Female", "Other"], key="m_gender")
+            gender = st.selectbox("Gender", GENDERS, key="m_gender")
             phone = st.text_input("Phone", key="m_phone")
             email = st.text_input("Email", key="m_email")
-            if st.button("Add patient", key="m_add_patient"):
+            if st.form_submit_button("Add patient"):
                 if fn and ln:
                     db.add_patient(fn, ln, dob or None, gender or None, phone or None, email or None)
                     st.rerun()
                 else:
                     st.error("First and last name required")
 
-        with st.expander("Update / Delete patient"):
-            patients = db.list_patients()
-            options = {f"{p['id']}: {p['first_name']} {p['last_name']}": p['id'] for p in patients}
-            sel = st.selectbox("Select patient", [""] + list(options.keys()), key="m_sel_patient")
-            if sel:
-                pid = options[sel]
-                p = db.get_patient(pid)
-                new_fn = st.text_input("First name", value=p['first_name'], key="u_fn")
-                new_ln = st.text_input("Last name", value=p['last_name'], key="u_ln")
-                new_dob = st.text_input("DOB (YYYY-MM-DD)", value=p.get('dob') or "", key="u_dob")
-                new_gender = st.selectbox("Gender", ["", "Male", "Female", "Other"], index=(0), key="u_gender")
-                new_phone = st.text_input("Phone", value=p.get('phone') or "", key="u_phone")
-                new_email = st.text_input("Email", value=p.get('email') or "", key="u_email")
-                if st.button("Update patient"):
-                    db.update_patient(pid, new_fn, new_ln, new_dob or None, new_gender or None, new_phone or None, new_email or None)
-                    st.success("Updated")
-                    st.rerun()
-                if st.button("Delete patient"):
-                    db.delete_patient(pid)
-                    st.success("Deleted")
-                    st.rerun()
+    with st.expander("Update / Delete patient"):
+        edit_patient()
+
+
+@st.fragment
+def edit_patient():
+    pid = search_picker("Select patient", db.search_patients, patient_label, "m_sel_patient")
+    if not pid:
+        return
+    p = db.get_patient(pid)
+    with st.form(f"u_patient_{pid}"):
+        new_fn = st.text_input("First name", value=p['first_name'])
+        new_ln = st.text_input("Last name", value=p['last_name'])
+        new_dob = st.text_input("DOB (YYYY-MM-DD)", value=p.get('dob') or "")
+        new_gender = st.selectbox("Gender", GENDERS, index=GENDERS.index(p['gender']) if p.get('gender') in GENDERS else 0)
+        new_phone = st.text_input("Phone", value=p.get('phone') or "")
+        new_email = st.text_input("Email", value=p.get('email') or "")
+        col_update, col_delete = st.columns(2)
+        update = col_update.form_submit_button("Update patient")
+        delete = col_delete.form_submit_button("Delete patient")
+    if update:
+        db.update_patient(pid, new_fn, new_ln, new_dob or None, new_gender or None, new_phone or None, new_email or None)
+        st.rerun()
+    if delete:
+        db.delete_patient(pid)
+        st.rerun()
 
-    # Doctors tab
-    with tabs[1]:
-        st.header("Doctors")
-        st.dataframe(db.list_doctors())
-        with st.expander("Add doctor"):
+
+def department_options():
+    return {f"{d['id']}: {d['name']}": d['id'] for d in data.departments}
+
+
+def manage_doctors():
+    st.header("Doctors")
+    st.dataframe(db.doctors_frame(), hide_index=True)
+    export_controls(["doctors"], "exp_doctors")
+    dept_map = department_options()
+
+    with st.expander("Add doctor"):
+        with st.form("ad_form", clear_on_submit=True):
             d_fn = st.text_input("First name", key="ad_fn")
             d_ln = st.text_input("Last name", key="ad_ln")
-            depts = db.list_departments()
-            dept_map = {f"{d['id']}: {d['name']}": d['id'] for d in depts}
             dept_sel = st.selectbox("Department (optional)", [""] + list(dept_map.keys()), key="ad_dept")
             d_email = st.text_input("Email", key="ad_email")
-            if st.button("Add doctor", key="ad_add"):
+            if st.form_submit_button("Add doctor"):
                 dept_id = dept_map[dept_sel] if dept_sel else None
                 db.add_doctor(d_fn, d_ln, dept_id, d_email or None)
                 st.rerun()
 
-        with st.expander("Update / Delete doctor"):
-            docs = db.list_doctors()
-            opts = {f"{d['id']}: Dr. {d['first_name']} {d['last_name']}": d['id'] for d in docs}
-            sel = st.selectbox("Select doctor", [""] + list(opts.keys()), key="ud_sel")
-            if sel:
-                did = opts[sel]
-                doc = db.get_doctor(did)
-                nf = st.text_input("First name", value=doc['first_name'], key="ud_fn")
-                nl = st.text_input("Last name", value=doc['last_name'], key="ud_ln")
-                dept_map = {f"{d['id']}: {d['name']}": d['id'] for d in db.list_departments()}
-                dept_choice = st.selectbox("Department", [""] + list(dept_map.keys()), key="ud_dept")
-                ne = st.text_input("Email", value=doc.get('email') or "", key="ud_email")
-                if st.button("Update doctor"):
-                    dept_id = dept_map[dept_choice] if dept_choice else None
-                    db.update_doctor(did, nf, nl, dept_id, ne or None)
-                    st.success("Updated")
-                    st.rerun()
-                if st.button("Delete doctor"):
-                    db.delete_doctor(did)
-                    st.success("Deleted")
-                    st.rerun()
+    with st.expander("Update / Delete doctor"):
+        edit_doctor(dept_map)
 
-    # Departments tab
-    with tabs[2]:
-        st.header("Departments")
-        st.dataframe(db.list_departments())
-        with st.expander("Add department"):
+
+@st.fragment
+def edit_doctor(dept_map):
+    did = search_picker("Select doctor", db.search_doctors, doctor_label, "ud_sel")
+    if not did:
+        return
+    doc = db.get_doctor(did)
+    labels = [""] + list(dept_map.keys())
+    current = next((label for label, i in dept_map.items() if i == doc.get('department_id')), "")
+    with st.form(f"ud_form_{did}"):
+        nf = st.text_input("First name", value=doc['first_name'])
+        nl = st.text_input("Last name", value=doc['last_name'])
+        dept_choice = st.selectbox("Department", labels, index=labels.index(current))
+        ne = st.text_input("Email", value=doc.get('email') or "")
+        col_update, col_delete = st.columns(2)
+        update = col_update.form_submit_button("Update doctor")
+        delete = col_delete.form_submit_button("Delete doctor")
+    if update:
+        db.update_doctor(did, nf, nl, dept_map[dept_choice] if dept_choice else None, ne or None)
+        st.rerun()
+    if delete:
+        db.delete_doctor(did)
+        st.rerun()
+
+
+def manage_departments():
+    st.header("Departments")
+    st.dataframe(db.departments_frame(), hide_index=True)
+    export_controls(["departments"], "exp_departments")
+
+    with st.expander("Add department"):
+        with st.form("adn_form", clear_on_submit=True):
             dn = st.text_input("Name", key="adn")
-            if st.button("Add department", key="adn_add"):
+            if st.form_submit_button("Add department"):
                 if dn:
                     db.add_department(dn)
                     st.rerun()
                 else:
                     st.error("Name required")
 
-        with st.expander("Update / Delete department"):
-            deps = db.list_departments()
-            opts = {f"{d['id']}: {d['name']}": d['id'] for d in deps}
-            sel = st.selectbox("Select department", [""] + list(opts.keys()), key="upd_dep")
-            if sel:
-                did = opts[sel]
-                dep = db.get_department(did)
-                new_name = st.text_input("Name", value=dep['name'], key="upd_dep_name")
-                if st.button("Update department"):
-                    db.update_department(did, new_name)
-                    st.success("Updated")
-                    st.rerun()
-                if st.button("Delete department"):
-                    db.delete_department(did)
-                    st.success("Deleted")
-                    st.rerun()
+    with st.expander("Update / Delete department"):
+        edit_department()
 
-    # Appointments tab
-    with tabs[3]:
-        st.header("Appointments")
-        appts = db.list_appointments()
-        # Present full table
-        st.dataframe([{
-            'id': a['id'],
-            'patient': f"{a['patient_first']} {a['patient_last']}",
-            'doctor': (f"Dr. {a['doctor_first']} {a['doctor_last']}" if a.get('doctor_first') else '(none)'),
-            'department': a.get('department_name') or '(none)',
-            'start_time': a['start_time'],
-            'status': a['status'],
-            'reason': a.get('reason') or ''
-        } for a in appts])
-
-        with st.expander("Add appointment"):
-            pats = db.list_patients()
-            docs = db.list_doctors()
-            deps = db.list_departments()
-            pat_map = {f"{p['id']}: {p['first_name']} {p['last_name']}": p['id'] for p in pats}
-            doc_map = {f"{d['id']}: Dr. {d['first_name']} {d['last_name']}": d['id'] for d in docs}
-            dep_map = {f"{d['id']}: {d['name']}": d['id'] for d in deps}
-            pat_sel = st.selectbox("Patient", list(pat_map.keys()), key="ap_pat")
-            doc_sel = st.selectbox("Doctor (optional)", [""] + list(doc_map.keys()), key="ap_doc")
-            dep_sel = st.selectbox("Department (optional)", [""] + list(dep_map.keys()), key="ap_dep")
-            start = st.text_input("Start datetime (ISO)", value=datetime.now().isoformat(), key="ap_start")
-            reason = st.text_input("Reason", key="ap_reason")
-            if st.button("Add appointment", key="ap_add"):
-                pid = pat_map[pat_sel]
-                did = doc_map[doc_sel] if doc_sel else None
-                didep = dep_map[dep_sel] if dep_sel else None
-                db.add_appointment(pid, did, didep, start, None, reason or None)
-                st.rerun()
 
-        with st.expander("Update / Delete appointment"):
-            ap = db.list_appointments()
-            opts = {f"{a['id']}: {a['patient_first']} {a['patient_last']} @ {a['start_time']}": a['id'] for a in ap}
-            sel = st.selectbox("Select appointment", [""] + list(opts.keys()), key="up_ap")
-            if sel:
-                aid = opts[sel]
-                a = db.get_appointment(aid)
-                pats = db.list_patients(); pat_map = {f"{p['id']}: {p['first_name']} {p['last_name']}": p['id'] for p in pats}
-                docs = db.list_doctors(); doc_map = {f"{d['id']}: Dr. {d['first_name']} {d['last_name']}": d['id'] for d in docs}
-                deps = db.list_departments(); dep_map = {f"{d['id']}: {d['name']}": d['id'] for d in deps}
-                pat_choice = st.selectbox("Patient", list(pat_map.keys()), index=0, key="up_ap_pat")
-                doc_choice = st.selectbox("Doctor (optional)", [""] + list(doc_map.keys()), key="up_ap_doc")
-                dep_choice = st.selectbox("Department (optional)", [""] + list(dep_map.keys()), key="up_ap_dep")
-                start = st.text_input("Start datetime (ISO)", value=a['start_time'], key="up_ap_start")
-                status = st.text_input("Status", value=a.get('status') or 'scheduled', key="up_ap_status")
-                reason = st.text_input("Reason", value=a.get('reason') or '', key="up_ap_reason")
-                if st.button("Update appointment"):
-                    pid = pat_map[pat_choice]
-                    did = doc_map[doc_choice] if doc_choice else None
-                    depid = dep_map[dep_choice] if dep_choice else None
-                    db.update_appointment(aid, pid, did, depid, start, None, status or 'scheduled', reason or None)
-                    st.success("Updated")
-                    st.rerun()
-                if st.button("Delete appointment"):
-                    db.delete_appointment(aid)
-                    st.success("Deleted")
-                    st.rerun()
+@st.fragment
+def edit_department():
+    opts = department_options()
+    sel = st.selectbox("Select department", [""] + list(opts.keys()), key="upd_dep")
+    if not sel:
+        return
+    did = opts[sel]
+    dep = db.get_department(did)
+    with st.form(f"upd_dep_form_{did}"):
+        new_name = st.text_input("Name", value=dep['name'])
+        col_update, col_delete = st.columns(2)
+        update = col_update.form_submit_button("Update department")
+        delete = col_delete.form_submit_button("Delete department")
+    if update:
+        db.update_department(did, new_name)
+        st.rerun()
+    if delete:
+        db.delete_department(did)
+        st.rerun()
+
+
+def manage_appointments():
+    st.header("Appointments")
+    col_status, col_history = st.columns([3, 1])
+    status_filter = col_status.text_input("Filter by status", key="m_appt_status")
+    history = col_history.checkbox("Include history", key="m_appt_history", help=f"Also list appointments archived after {db.ARCHIVE_AFTER_DAYS} days")
+    st.dataframe(paged("manage_appointments", db.appointments_frame, status=status_filter or None, include_history=history), hide_index=True)
+    export_controls(["appointments_view", "appointments"], "exp_appointments")
+    dep_map = department_options()
+
+    with st.expander("Add appointment"):
+        add_appointment(dep_map)
+
+    with st.expander("Update / Delete appointment"):
+        edit_appointment(dep_map)
+
+
+@st.fragment
+def add_appointment(dep_map):
+    # Pickers sit outside the form so each search reruns just this fragment.
+    pid = search_picker("Patient", db.search_patients, patient_label, "ap_pat")
+    did = search_picker("Doctor (optional)", db.search_doctors, doctor_label, "ap_doc")
+    with st.form("ap_form"):
+        dep_sel = st.selectbox("Department (optional)", [""] + list(dep_map.keys()), key="ap_dep")
+        start = st.text_input("Start datetime (ISO)", value=datetime.now().isoformat(timespec="minutes"), key="ap_start")
+        duration = st.number_input("Duration (minutes)", min_value=5, max_value=db.MAX_DURATION_MIN, value=db.DEFAULT_DURATION_MIN, step=5, key="ap_duration")
+        reason = st.text_input("Reason", key="ap_reason")
+        submitted = st.form_submit_button("Add appointment")
+    if submitted:
+        didep = dep_map[dep_sel] if dep_sel else None
+        if not pid:
+            st.error("No patient selected.")
+        elif book(lambda: db.add_appointment(pid, did, didep, start, end_of(start, duration), reason or None), did, didep, pid, start, duration):
+            st.rerun()
+
+
+@st.fragment
+def edit_appointment(dep_map):
+    # Find the patient first, then pick among their latest appointments.
+    owner = search_picker("Patient", db.search_patients, patient_label, "up_ap_owner")
+    ap = db.list_appointments_page(patient_id=owner)[0] if owner else []
+    opts = {f"{a['id']}: {a['start_time']} — {a.get('status')}": a['id'] for a in ap}
+    sel = st.selectbox("Select appointment", [""] + list(opts.keys()), key="up_ap")
+    if not sel:
+        return
+    aid = opts[sel]
+    a = db.get_appointment(aid)
+    current_doc = db.get_doctor(a['doctor_id']) if a.get('doctor_id') else None
+    pid = search_picker("Patient", db.search_patients, patient_label, "up_ap_pat", current=db.get_patient(a['patient_id']))
+    did = search_picker("Doctor (optional)", db.search_doctors, doctor_label, "up_ap_doc", current=current_doc)
+    labels = [""] + list(dep_map.keys())
+    current_dep = next((label for label, i in dep_map.items() if i == a.get('department_id')), "")
+    with st.form(f"up_ap_form_{aid}"):
+        dep_choice = st.selectbox("Department (optional)", labels, index=labels.index(current_dep))
+        start = st.text_input("Start datetime (ISO)", value=a['start_time'])
+        duration = st.number_input("Duration (minutes)", min_value=5, max_value=db.MAX_DURATION_MIN, value=min(duration_of(a), db.MAX_DURATION_MIN), step=5)
+        status = st.text_input("Status", value=a.get('status') or 'scheduled')
+        reason = st.text_input("Reason", value=a.get('reason') or '')
+        col_update, col_delete = st.columns(2)
+        update = col_update.form_submit_button("Update appointment")
+        delete = col_delete.form_submit_button("Delete appointment")
+    if update:
+        depid = dep_map[dep_choice] if dep_choice else None
+        if book(lambda: db.update_appointment(aid, pid, did, depid, start, end_of(start, duration), status or 'scheduled', reason or None) or True, did, depid, pid, start, duration):
+            st.rerun()
+    if delete:
+        db.delete_appointment(aid)
+        st.rerun()
+
+
+MANAGE_SECTIONS = {
+    "Patients": manage_patients,
+    "Doctors": manage_doctors,
+    "Departments": manage_departments,
+    "Appointments": manage_appointments,
+}
+
+
+def manage_page():
+    st.title("Manage — Hospital Data")
+    # A selector rather than st.tabs: tabs run every body on each rerun,
+    # this only runs (and queries for) the visible section.
+    section = st.radio("Section", list(MANAGE_SECTIONS), horizontal=True, key="m_section")
+    MANAGE_SECTIONS[section]()
+
+
+def import_page():
+    st.title("Import records")
+    table = st.selectbox("Table", list(transfer.IMPORTERS.keys()), key="imp_table")
+    columns = db.PATIENT_COLUMNS if table == "patients" else db.APPOINTMENT_COLUMNS
+    st.caption("Expected columns: " + ", ".join(columns))
+    upload = st.file_uploader("CSV or Parquet file", type=["csv", "parquet"], key="imp_file")
+    chunk_size = st.number_input("Rows per transaction", min_value=100, max_value=100_000, value=transfer.IMPORT_CHUNK_SIZE, step=100, key="imp_chunk")
+    if upload and st.button("Import", key="imp_go"):
+        progress = st.empty()
+
+        def report(seen, inserted, errors):
+            progress.info(f"Processed {seen:,} rows: {inserted:,} inserted, {errors:,} rejected")
+
+        try:
+            result = transfer.import_file(table, upload, upload.name, int(chunk_size), report)
+        except ValueError as exc:
+            st.error(str(exc))
+            return
+        st.success(f"Imported {result.inserted:,} {table}")
+        if result.errors:
+            st.warning(f"{len(result.errors):,} rows rejected (showing first 100)")
+            st.dataframe([{"row": i, "error": msg} for i, msg in result.errors[:100]], hide_index=True)
+
+
+def admin_page():
+    st.title("Admin — query profile")
+    # Read-only here: the settings are shared by every session in the
+    # process, so they come from the environment (see profiler.py).
+    st.caption(
+        f"Profiling {'on' if profiler.ENABLED else 'off'} (HOSPITAL_PROFILE), "
+        f"slow threshold {profiler.SLOW_QUERY_MS:g} ms (HOSPITAL_PROFILE_SLOW_MS), "
+        f"slow-query log {profiler.LOG_PATH or 'off'} (HOSPITAL_PROFILE_LOG)"
+    )
+    if st.button("Clear buffer", key="adm_clear"):
+        profiler.clear()
+
+    st.header("Write queue")
+    stats = db.write_stats()
+    cols = st.columns(6)
+    cols[0].metric("Queue depth", stats["depth"])
+    cols[1].metric("Committed", f"{stats['committed']:,}")
+    cols[2].metric("Failed", f"{stats['failed']:,}")
+    cols[3].metric("Writes / batch", f"{stats.get('writes_per_batch', 0):.1f}")
+    cols[4].metric("Commit p50 / p95", f"{stats.get('commit_p50_ms', 0):.2f} / {stats.get('commit_p95_ms', 0):.2f} ms")
+    cols[5].metric("Write p50 / p95", f"{stats.get('latency_p50_ms', 0):.1f} / {stats.get('latency_p95_ms', 0):.1f} ms")
+
+    snap = db.snapshot_stats()
+    if snap["refreshes"]:
+        st.header("Read snapshot")
+        cols = st.columns(4)
+        cols[0].metric("Age", f"{snap['age_s']:.1f} s")
+        cols[1].metric("Copies", f"{snap['refreshes']:,}")
+        cols[2].metric("Copy p50 / max", f"{snap.get('copy_p50_ms', 0):.1f} / {snap.get('copy_max_ms', 0):.1f} ms")
+        cols[3].metric("Failed copies", snap["errors"])
+        st.caption(f"Reads use a copy of {db.DB_PATH} checked for new commits every {snap['interval_s']:g} s.")
+
+    st.header("Archive")
+    with st.form("adm_archive"):
+        days = st.number_input("Archive appointments older than (days)", min_value=1, value=db.ARCHIVE_AFTER_DAYS, step=30)
+        if st.form_submit_button("Archive now"):
+            moved = db.archive_appointments(older_than_days=int(days))
+            st.success(f"Moved {moved:,} appointments to the archive")
+    archive = db.archive_stats()
+    cols = st.columns(3)
+    cols[0].metric("Archived appointments", f"{archive['archived']:,}")
+    cols[1].metric("Archived range", f"{(archive['oldest_archived'] or '-')[:10]} – {(archive['newest_archived'] or '-')[:10]}")
+    cols[2].metric("Oldest current", (archive["oldest_hot"] or "-")[:10])
+    st.caption(f"Archive file: {archive['path']}")
+
+    queries = profiler.records("query")
+    st.caption(f"{len(profiler.records()):,} records buffered (last {profiler.RING_SIZE:,}), {len(queries):,} statements")
+
+    st.header("Reruns")
+    st.dataframe(profiler.summary("rerun"), hide_index=True, column_order=("function", "count", "total_ms", "p50_ms", "p95_ms", "max_ms", "queries"))
+    st.header("Top queries by total time")
+    st.dataframe(profiler.summary("query")[:25], hide_index=True, column_order=("function", "sql", "count", "total_ms", "p50_ms", "p95_ms", "max_ms", "rows"))
+    st.header("db functions")
+    st.dataframe(profiler.summary("call")[:25], hide_index=True, column_order=("function", "count", "total_ms", "p50_ms", "p95_ms", "max_ms", "queries", "rows"))
+    st.header(f"Slow records (>= {profiler.SLOW_QUERY_MS:g} ms)")
+    slow = [r.as_dict() for r in reversed(profiler.records()) if r.kind != "rerun" and r.slow]
+    if slow:
+        st.dataframe(slow[:100], hide_index=True)
+    else:
+        st.info("No slow records in the buffer.")
 
 
 if page == "Home":
     home_page()
-else:
+elif page == "Calendar":
+    calendar_page()
+elif page == "Manage":
     manage_page()
+elif page == "Import":
+    import_page()
+else:
+    admin_page()
+
+totals = profiler.run_totals()
+st.sidebar.caption(
+    f"{db.query_count()} db queries ({totals['query_ms']:.1f} ms), "
+    f"{data.fetches} datasets this run"
+)
+profiler.end_run(page)
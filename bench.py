@@ -0,0 +1,866 @@
+"""Standalone benchmarks for the database layer.
+
+Usage:
+    python bench.py connections [--renders N]
+    python bench.py plans [--appointments N]
+    python bench.py frames [--appointments N]
+    python bench.py schedule [--appointments N] [--checks N]
+    python bench.py startup [--runs N]
+    python bench.py readers [--processes N] [--sessions N] [--seconds S]
+    python bench.py suite [--sizes 1000,100000,1000000] [--out results.json]
+    python bench.py compare BASELINE.json CURRENT.json [--threshold 1.25]
+
+Benchmarks run against a throwaway copy of the database in a temporary
+directory; hospital.db is never touched.
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import db
+from profiler import percentile
+
+
+@contextmanager
+def scratch_db(source: Optional[str] = "hospital.db"):
+    """Point db.DB_PATH at a temporary copy of `source` for the duration.
+
+    A missing `source` gives a freshly initialised demo database; None
+    gives an empty one (schema only).
+    """
+    tmp = tempfile.mkdtemp(prefix="hospital-bench-")
+    path = os.path.join(tmp, "hospital.db")
+    if source and os.path.exists(source):
+        shutil.copy(source, path)
+    old_path = db.DB_PATH
+    db.DB_PATH = path
+    try:
+        if source is None or os.path.exists(source):
+            db.migrate()
+        else:
+            db.init_db()
+        yield path
+    finally:
+        db.close_writer()
+        db.close_snapshot()
+        db.close_pool()
+        db.DB_PATH = old_path
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def populate(appointments: int, patients: int = 0, doctors: int = 200) -> None:
+    """Bulk-fill the current database with synthetic rows."""
+    import seed
+
+    conn = db.connect()
+    with seed.deferred_indexes(conn):
+        seed.generate(
+            conn,
+            doctors=doctors,
+            patients=patients or max(1, appointments // 5),
+            appointments=appointments,
+            days_back=365,
+            days_ahead=90,
+            seed=0,
+        )
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def render_home() -> None:
+    """The sequence of reads a Home page render performs."""
+    db.list_patients()
+    db.list_doctors()
+    db.list_patients()
+    db.list_doctors()
+    db.list_departments()
+    db.list_appointments()
+
+
+def timed(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def bench_connections(args) -> None:
+    with scratch_db():
+        for label, size in (("connect per call", 0), ("pooled", db.POOL_SIZE or 8)):
+            # Disable the read cache so every render really hits the database.
+            old_size, old_cache = db.POOL_SIZE, db.CACHE_SIZE
+            db.POOL_SIZE, db.CACHE_SIZE = size, 0
+            try:
+                pool = db.get_pool()
+                samples = timed(render_home, args.renders)
+                connects = pool.connects
+            finally:
+                db.POOL_SIZE, db.CACHE_SIZE = old_size, old_cache
+                db.close_pool()
+            total = sum(samples)
+            print(
+                f"{label:>17}: {args.renders} renders in {total:.3f}s, "
+                f"{connects / total:,.0f} connects/s ({connects} total), "
+                f"render p50={statistics.median(samples) * 1e3:.2f}ms "
+                f"p95={percentile(samples, 95) * 1e3:.2f}ms"
+            )
+
+
+# Functions that intentionally return a whole table; a scan is their job.
+FULL_DUMPS = {"list_appointments", "list_patients", "list_doctors", "list_departments"}
+# Fixed-size bookkeeping tables where a scan is cheaper than an index.
+SMALL_TABLES = {"table_versions", "patients_fts_config", "doctors_fts_config"}
+# Readers of the stats_* summaries, whose size is bounded by doctors and
+# departments rather than history; scanning and sorting them is fine.
+# archive_stats counts the archive for the Admin page, which is a whole-table
+# aggregate by definition.
+AGGREGATES = {"appointments_by_department", "appointments_by_doctor", "stats_totals", "archive_stats"}
+# A SCAN step reads every row of the table or index it names. Walking an
+# index in order is only acceptable when a LIMIT stops it early and no
+# WHERE clause can make it skip rows on the way (see index_walk_ok).
+FULL_SCAN = re.compile(r"\bSCAN ([\w.]+)(?! VIRTUAL TABLE)(?:\s|$)")
+INDEX_WALK = re.compile(r"\bSCAN [\w.]+ USING (?:COVERING )?INDEX\b")
+# A plan driven by a full-text MATCH only sorts the matching rows.
+FTS_MATCH = re.compile(r"\bVIRTUAL TABLE INDEX \d+:M")
+
+
+def index_walk_ok(sql: str) -> bool:
+    """Whether an in-order index walk in this statement is bounded: a LIMIT and nothing to filter on."""
+    return bool(re.search(r"\bLIMIT\b", sql)) and not re.search(r"\bWHERE\b", sql)
+
+
+def hot_queries(conn):
+    """Call every db.py read/write path once, yielding (function, sql) pairs."""
+    row = conn.execute("SELECT id, patient_id, doctor_id, department_id FROM appointments LIMIT 1").fetchone()
+    aid, pid, did, depid = row
+    name = conn.execute("SELECT first_name FROM patients WHERE id = ?", (pid,)).fetchone()[0]
+    page, cursor = db.list_appointments_page(limit=10)
+    calls = [
+        ("list_patients", lambda: db.list_patients()),
+        ("list_patients_page", lambda: db.list_patients_page()),
+        ("list_patients_page", lambda: db.list_patients_page(after=db.list_patients_page(limit=5)[1])),
+        ("list_patients_page", lambda: db.list_patients_page(name=name[:3])),
+        ("get_patient", lambda: db.get_patient(pid)),
+        ("search_patients", lambda: db.search_patients(name[:3])),
+        ("search_doctors", lambda: db.search_doctors(name[:3])),
+        ("list_departments", lambda: db.list_departments()),
+        ("get_department", lambda: db.get_department(depid)),
+        ("add_department", lambda: db.add_department("Cardiology")),
+        ("list_doctors", lambda: db.list_doctors()),
+        ("get_doctor", lambda: db.get_doctor(did)),
+        ("list_appointments", lambda: db.list_appointments()),
+        ("list_appointments_page", lambda: db.list_appointments_page()),
+        ("list_appointments_page", lambda: db.list_appointments_page(after=cursor)),
+        ("list_appointments_page", lambda: db.list_appointments_page(descending=False)),
+        ("list_appointments_page", lambda: db.list_appointments_page(patient_id=pid)),
+        ("list_appointments_page", lambda: db.list_appointments_page(doctor_id=did)),
+        ("list_appointments_page", lambda: db.list_appointments_page(department_id=depid)),
+        ("list_appointments_page", lambda: db.list_appointments_page(status="scheduled")),
+        ("list_appointments_page", lambda: db.list_appointments_page(after=cursor, patient_id=pid, include_history=True)),
+        ("appointments_frame", lambda: db.appointments_frame(after=cursor, doctor_id=did)),
+        ("appointments_frame", lambda: db.appointments_frame(after=cursor, include_history=True)),
+        ("patients_frame", lambda: db.patients_frame()),
+        ("get_appointment", lambda: db.get_appointment(aid)),
+        ("appointments_per_day", lambda: db.appointments_per_day()),
+        ("appointments_by_department", lambda: db.appointments_by_department()),
+        ("appointments_by_doctor", lambda: db.appointments_by_doctor()),
+        ("stats_totals", lambda: db.stats_totals()),
+        ("find_conflict", lambda: db.find_conflict(did, pid, "2030-01-07T10:00:00")),
+        ("next_free_slots", lambda: db.next_free_slots(doctor_id=did, patient_id=pid, after="2030-01-07T08:00:00")),
+        ("next_free_slots", lambda: db.next_free_slots(department_id=depid, after="2030-01-07T08:00:00")),
+        ("add_appointment", lambda: db.add_appointment(pid, did, depid, "2031-01-07T10:00:00")),
+        ("update_appointment", lambda: db.update_appointment(aid, pid, did, depid, "2030-01-01 09:00:00", None, "scheduled", None)),
+        ("delete_appointment", lambda: db.delete_appointment(aid)),
+        ("archive_appointments", lambda: db.archive_appointments(older_than_days=360, batch_size=100)),
+        ("get_appointment", lambda: db.get_appointment(aid, include_history=True)),
+        ("archive_stats", lambda: db.archive_stats()),
+        ("appointments_between", lambda: db.appointments_between("2030-01-07", "2030-01-14", doctor_id=did)),
+        ("appointments_between", lambda: db.appointments_between("2030-01-07", "2030-01-14", department_id=depid)),
+        ("appointments_between", lambda: db.appointments_between("2030-01-07", "2030-01-14", patient_id=pid)),
+        ("appointments_between", lambda: db.appointments_between("2029-01-01", "2029-01-08", doctor_id=did, include_history=True)),
+    ]
+    for name, call in calls:
+        db.clear_cache()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            conn.set_trace_callback(None)
+        # Trigger bodies are traced as their top-level statement, once per row.
+        for sql in dict.fromkeys(statements):
+            if re.match(r"\s*(WITH|SELECT|INSERT|UPDATE|DELETE)\b", sql, re.I):
+                yield name, sql
+
+
+def bench_plans(args) -> None:
+    """Fail if a hot query's plan contains a full table scan or a temp sort."""
+    failures = []
+    with scratch_db():
+        populate(args.appointments)
+        with db.get_conn() as conn:
+            for name, sql in hot_queries(conn):
+                plan = [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+                bad = []
+                for step in plan:
+                    scan = FULL_SCAN.search(step)
+                    if name in AGGREGATES:
+                        continue
+                    if scan and INDEX_WALK.search(step) and index_walk_ok(sql):
+                        continue
+                    if scan and scan.group(1).rsplit(".", 1)[-1] not in SMALL_TABLES and name not in FULL_DUMPS:
+                        bad.append(step)
+                    elif "TEMP B-TREE" in step and not any(FTS_MATCH.search(s) for s in plan):
+                        bad.append(step)
+                status = "FAIL" if bad else "ok"
+                print(f"{status:>4}  {name}: {' | '.join(plan)}")
+                if bad:
+                    failures.append(name)
+    if failures:
+        print(f"\n{len(failures)} query plan regression(s): {', '.join(sorted(set(failures)))}")
+        sys.exit(1)
+
+
+def measure(fn):
+    """Return (result, seconds, peak traced bytes); timing excludes tracemalloc overhead."""
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench_frames(args) -> None:
+    """Dict-per-row listing vs the columnar DataFrame / Arrow fetch path."""
+    import pandas as pd
+
+    def dict_rows():
+        appts = db.list_appointments()
+        return pd.DataFrame([{
+            "id": a["id"],
+            "patient": f"{a['patient_first']} {a['patient_last']}",
+            "doctor": (f"Dr. {a['doctor_first']} {a['doctor_last']}" if a.get("doctor_first") else "(none)"),
+            "department": a.get("department_name") or "(none)",
+            "start_time": a["start_time"],
+            "status": a["status"],
+            "reason": a.get("reason") or "",
+        } for a in appts])
+
+    with scratch_db():
+        populate(args.appointments)
+        paths = (
+            ("list of dicts", dict_rows),
+            ("appointments_frame", lambda: db.appointments_frame(limit=None)[0]),
+            ("fetch_arrow", lambda: db.fetch_arrow(db.APPOINTMENT_FRAME_SELECT)),
+        )
+        # Time the fetch itself, not a read-cache hit.
+        old_cache = db.CACHE_SIZE
+        db.CACHE_SIZE = 0
+        try:
+            for label, fn in paths:
+                fn()  # warm the page cache
+                result, elapsed, peak = measure(fn)
+                print(f"{label:>18}: {len(result):,} rows in {elapsed:.3f}s, peak {peak / 2**20:.1f} MiB")
+        finally:
+            db.CACHE_SIZE = old_cache
+
+
+def bench_schedule(args) -> None:
+    """Latency of conflict checks and free-slot searches against a large appointments table."""
+    import random
+
+    rng = random.Random(1)
+    with scratch_db():
+        populate(args.appointments)
+        with db.get_conn() as conn:
+            doctor_ids = [r[0] for r in conn.execute("SELECT id FROM doctors")]
+            patient_ids = [r[0] for r in conn.execute("SELECT id FROM patients")]
+            department_ids = [r[0] for r in conn.execute("SELECT id FROM departments")]
+            lo, hi = conn.execute("SELECT MIN(start_time), MAX(start_time) FROM appointments").fetchone()
+        lo, hi = db._as_datetime(lo), db._as_datetime(hi)
+        span = int((hi - lo).total_seconds() // 900)
+
+        def random_start():
+            return db._iso(lo + timedelta(minutes=15 * rng.randrange(span)))
+
+        cases = (
+            ("find_conflict", lambda: db.find_conflict(rng.choice(doctor_ids), rng.choice(patient_ids), random_start()), args.checks),
+            ("next_free_slots (doctor)", lambda: db.next_free_slots(doctor_id=rng.choice(doctor_ids), after=random_start()), args.checks // 10),
+            ("next_free_slots (department)", lambda: db.next_free_slots(department_id=rng.choice(department_ids), after=random_start()), args.checks // 100),
+        )
+        with db.get_conn():
+            for label, fn, repeat in cases:
+                samples = timed(fn, max(1, repeat))
+                print(
+                    f"{label:>28}: n={len(samples):,} mean={statistics.mean(samples) * 1e6:,.0f}us "
+                    f"p50={statistics.median(samples) * 1e6:,.0f}us p95={percentile(samples, 95) * 1e6:,.0f}us"
+                )
+
+
+# Modules only some pages or commands need; importing the app's own
+# modules must not pull them in.
+HEAVY_MODULES = ("faker", "numpy", "pandas", "pyarrow", "seed")
+
+# Runs in a fresh interpreter per sample: prints one JSON line of timings.
+STARTUP_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import db, profiler, transfer
+t1 = time.perf_counter()
+heavy = [m for m in {heavy!r} if m in sys.modules]
+db.DB_PATH = {path!r}
+db.ensure_schema()
+t2 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t3 = time.perf_counter()
+at = AppTest.from_file({app!r}, default_timeout=300)
+at.run()
+t4 = time.perf_counter()
+at.run()
+t5 = time.perf_counter()
+if at.exception:
+    raise SystemExit(at.exception[0].value)
+print(json.dumps({{
+    "import_ms": (t1 - t0) * 1e3, "ensure_schema_ms": (t2 - t1) * 1e3, "import_streamlit_ms": (t3 - t2) * 1e3,
+    "first_render_ms": (t4 - t3) * 1e3, "rerun_ms": (t5 - t4) * 1e3, "heavy": heavy,
+}}))
+"""
+
+
+def bench_startup(args) -> None:
+    """Cold-process import time, schema check and first Home render, one fresh interpreter per run."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    with scratch_db() as path:
+        db.close_pool()
+        probe = STARTUP_PROBE.format(heavy=HEAVY_MODULES, path=path, app=os.path.join(here, "app.py"))
+        runs = []
+        for _ in range(args.runs):
+            out = subprocess.run([sys.executable, "-c", probe], cwd=here, capture_output=True, text=True)
+            if out.returncode:
+                sys.exit(out.stderr.strip() or out.stdout.strip())
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    for key in ("import_ms", "ensure_schema_ms", "import_streamlit_ms", "first_render_ms", "rerun_ms"):
+        samples = [r[key] for r in runs]
+        print(f"{key[:-3]:>20}: p50={statistics.median(samples):8.1f}ms  max={max(samples):8.1f}ms")
+    heavy = sorted({m for r in runs for m in r["heavy"]})
+    if heavy:
+        print(f"\nimporting db, profiler and transfer loaded: {', '.join(heavy)}")
+        sys.exit(1)
+
+
+def browse_ops(rng: random.Random) -> List[tuple]:
+    """(name, call) pairs for what a session on the Manage page reads, with ids from the current database."""
+    with db.get_conn() as conn:
+        max_pid = conn.execute("SELECT MAX(id) FROM patients").fetchone()[0]
+        max_aid = conn.execute("SELECT MAX(id) FROM appointments").fetchone()[0]
+        doctor_ids = [r[0] for r in conn.execute("SELECT id FROM doctors")]
+        names = [r[0] for r in conn.execute("SELECT last_name FROM patients ORDER BY random() LIMIT 100")]
+        lo, hi = conn.execute("SELECT MIN(start_time), MAX(start_time) FROM appointments").fetchone()
+    lo, hi = db._as_datetime(lo), db._as_datetime(hi)
+
+    def week():
+        start = lo + timedelta(days=rng.randint(0, max(0, (hi - lo).days)))
+        return db._iso(start), db._iso(start + timedelta(days=7))
+
+    return [
+        ("patients_frame", lambda: db.patients_frame(name=rng.choice(names)[:3])),
+        ("search_patients", lambda: db.search_patients(rng.choice(names)[:3])),
+        ("list_appointments_page(patient)", lambda: db.list_appointments_page(patient_id=rng.randint(1, max_pid))),
+        ("appointments_frame(doctor)", lambda: db.appointments_frame(doctor_id=rng.choice(doctor_ids))),
+        ("appointments_frame(status, 1000)", lambda: db.appointments_frame(limit=1000, status="scheduled")),
+        ("appointments_between(doctor)", lambda: db.appointments_between(*week(), doctor_id=rng.choice(doctor_ids))),
+        ("get_appointment", lambda: db.get_appointment(rng.randint(1, max_aid))),
+    ]
+
+
+def reader_process(path: str, snapshot: bool, interval: float, sessions: int, start_at: float, seconds: float, seed: int) -> dict:
+    """One server process: `sessions` threads browsing until the deadline; returns read latencies in ms."""
+    import threading
+
+    db.DB_PATH = path
+    db.SNAPSHOT_READS = snapshot
+    db.SNAPSHOT_INTERVAL_S = interval
+    # Every read should reach SQLite; with the cache on, snapshot reads
+    # would mostly be cache hits between copies.
+    db.CACHE_SIZE = 0
+    if snapshot:
+        db.get_snapshot()  # take the first copy before the clock starts
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    def session(i: int) -> None:
+        rng = random.Random(seed * 1000 + i)
+        ops = browse_ops(rng)
+        time.sleep(max(0.0, start_at - time.time()))
+        deadline = start_at + seconds
+        while time.time() < deadline:
+            _, call = rng.choice(ops)
+            t0 = time.perf_counter()
+            try:
+                call()
+            except sqlite3.Error as exc:
+                errors.append(str(exc))
+                continue
+            latencies.append((time.perf_counter() - t0) * 1e3)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = db.snapshot_stats()
+    db.close_snapshot()
+    db.close_pool()
+    return {"latencies": latencies, "errors": errors, "snapshot": stats}
+
+
+def writer_process(path: str, start_at: float, seconds: float, seed: int) -> dict:
+    """Books appointments back to back through the write queue until the deadline; returns write latencies in ms."""
+    db.DB_PATH = path
+    rng = random.Random(seed)
+    with db.get_conn() as conn:
+        max_pid = conn.execute("SELECT MAX(id) FROM patients").fetchone()[0]
+        doctors = conn.execute("SELECT id, department_id FROM doctors").fetchall()
+    future = datetime(2100, 1, 1, 9)
+    latencies: List[float] = []
+    errors: List[str] = []
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline, hour = start_at + seconds, 0
+    while time.time() < deadline:
+        hour += 1
+        did, dep = rng.choice(doctors)
+        t0 = time.perf_counter()
+        try:
+            db.add_appointment(rng.randint(1, max_pid), did, dep, db._iso(future + timedelta(hours=hour)))
+        except (sqlite3.Error, db.SchedulingConflict) as exc:
+            errors.append(str(exc))
+            continue
+        latencies.append((time.perf_counter() - t0) * 1e3)
+    db.close_writer()
+    db.close_pool()
+    return {"latencies": latencies, "errors": errors}
+
+
+def bench_readers(args) -> None:
+    """Many reader sessions in several processes against one writer, reading the primary vs a snapshot."""
+    import multiprocessing
+
+    def line(label: str, samples: List[float]) -> str:
+        if not samples:
+            return f"{label} none"
+        return (f"{label} {len(samples) / args.seconds:8,.0f}/s  p50={statistics.median(samples):7.2f}ms "
+                f"p95={percentile(samples, 95):7.2f}ms p99={percentile(samples, 99):7.2f}ms")
+
+    with scratch_db() as path:
+        populate(args.appointments)
+        db.close_pool()
+        # Each mode gets its own copy of the populated database, so both
+        # start from the same rows.
+        copies = {}
+        for mode in args.modes:
+            copies[mode] = os.path.join(os.path.dirname(path), f"{mode}.db")
+            for src, dst in ((path, copies[mode]), (db.archive_path(path), db.archive_path(copies[mode]))):
+                if os.path.exists(src):
+                    shutil.copy(src, dst)
+        context = multiprocessing.get_context("spawn")
+        for mode in args.modes:
+            snapshot = mode == "snapshot"
+            with ProcessPoolExecutor(args.processes + 1, mp_context=context) as pool:
+                # Leave time for the processes to start and take their first snapshot.
+                start_at = time.time() + args.warmup
+                readers = [
+                    pool.submit(reader_process, copies[mode], snapshot, args.interval, args.sessions, start_at, args.seconds, i)
+                    for i in range(args.processes)
+                ]
+                writer = pool.submit(writer_process, copies[mode], start_at, args.seconds, 0) if args.writer else None
+                reads = [f.result() for f in readers]
+                writes = writer.result() if writer else None
+            print(f"{mode} ({args.processes} processes x {args.sessions} sessions, {args.seconds:g}s):")
+            print(line("    reads ", [ms for r in reads for ms in r["latencies"]]))
+            if writes:
+                print(line("    writes", writes["latencies"]))
+            if snapshot:
+                copies_made = sum(r["snapshot"].get("refreshes", 0) for r in reads)
+                copy_ms = [r["snapshot"]["copy_p50_ms"] for r in reads if "copy_p50_ms" in r["snapshot"]]
+                print(f"    snapshot copies: {copies_made} in total, p50 {statistics.median(copy_ms) if copy_ms else 0:.1f}ms per copy")
+            errors = [e for r in reads for e in r["errors"]] + (writes["errors"] if writes else [])
+            if errors:
+                print(f"    {len(errors)} errors, e.g. {errors[0]}")
+
+
+# Plumbing with no database work of its own, and init_db, which seeds
+# unseeded random rows; every other public db.py function is in the suite.
+NOT_BENCHMARKED = {
+    "query_count", "reset_query_count", "get_pool", "close_pool", "get_conn",
+    "transaction", "cached", "clear_cache", "init_db", "get_writer", "close_writer",
+    "queued", "write_stats", "archive_path", "ensure_schema", "read_conn", "get_snapshot",
+    "close_snapshot", "snapshot_stats",
+}
+
+
+class Case(NamedTuple):
+    group: str
+    name: str
+    fn: Callable
+    setup: Optional[Callable] = None  # untimed; its result is passed to fn
+    items: int = 1  # rows handled per call, for throughput
+
+
+def sample(case: Case, budget: float, min_samples: int, max_samples: int) -> List[float]:
+    """Time `case` until `budget` seconds are spent (within the sample bounds)."""
+    samples = []
+    spent = 0.0
+    while len(samples) < max_samples and (len(samples) < min_samples or spent < budget):
+        arg = case.setup() if case.setup else None
+        t0 = time.perf_counter()
+        case.fn(arg) if case.setup else case.fn()
+        elapsed = time.perf_counter() - t0
+        samples.append(elapsed)
+        spent += elapsed
+    return samples
+
+
+def peak_memory(case: Case) -> int:
+    arg = case.setup() if case.setup else None
+    tracemalloc.start()
+    try:
+        case.fn(arg) if case.setup else case.fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def function_cases() -> List[Case]:
+    """One or more cases per public db.py function, using ids from the current database."""
+    rng = random.Random(0)
+    with db.get_conn() as conn:
+        max_pid = conn.execute("SELECT MAX(id) FROM patients").fetchone()[0]
+        doctor_ids = [r[0] for r in conn.execute("SELECT id FROM doctors")]
+        department_ids = [r[0] for r in conn.execute("SELECT id FROM departments")]
+        max_aid = conn.execute("SELECT MAX(id) FROM appointments").fetchone()[0]
+        name = conn.execute("SELECT last_name FROM patients WHERE id = ?", (max_pid,)).fetchone()[0]
+        first_start, last_start = conn.execute("SELECT MIN(start_time), MAX(start_time) FROM appointments").fetchone()
+    page_cursor = db.list_appointments_page(limit=db.PAGE_SIZE)[1]
+    counter = iter(range(1, 10**9))
+    future = datetime(2100, 1, 1, 9)
+
+    def pid():
+        return rng.randint(1, max_pid)
+
+    def slot():
+        # A fresh hour far in the future: never conflicts with seeded rows.
+        return db._iso(future + timedelta(hours=next(counter)))
+
+    def week():
+        # A random seeded week, as the calendar view asks for it.
+        lo, hi = db._as_datetime(first_start), db._as_datetime(last_start)
+        start = lo + timedelta(days=rng.randint(0, max(0, (hi - lo).days)))
+        return db._iso(start), db._iso(start + timedelta(days=7))
+
+    def new_patient():
+        return db.add_patient("Bench", "Patient")
+
+    def new_appointment():
+        return db.add_appointment(new_patient(), None, None, slot())
+
+    patient_rows = lambda n: [{"first_name": "Bulk", "last_name": f"Patient{i}"} for i in range(n)]
+    appointment_rows = lambda n: [{"patient_id": pid(), "start_time": slot()} for _ in range(n)]
+    dep, doc = department_ids[0], doctor_ids[0]
+
+    def versions():
+        with db.get_conn() as conn:
+            return db.table_versions(conn, ("patients",))
+
+    return [
+        Case("schema", "connect", lambda: db.connect().close()),
+        Case("schema", "apply_schema", lambda: db.apply_schema()),
+        Case("schema", "migrate", lambda: db.migrate()),
+        Case("schema", "schema_version", lambda: db.schema_version()),
+        Case("schema", "table_versions", versions),
+        Case("maintenance", "rebuild_search_index", lambda: db.rebuild_search_index()),
+        Case("maintenance", "rebuild_stats", lambda: db.rebuild_stats()),
+        Case("maintenance", "rebuild_derived", lambda: db.rebuild_derived()),
+        Case("read", "fetch_frame", lambda: db.fetch_frame("SELECT * FROM doctors")),
+        Case("read", "fetch_arrow", lambda: db.fetch_arrow("SELECT * FROM doctors")),
+        Case("read", "list_patients", lambda: db.list_patients()),
+        Case("read", "list_patients_page", lambda: db.list_patients_page()),
+        Case("read", "list_patients_page(name)", lambda: db.list_patients_page(name=name[:3])),
+        Case("read", "patients_frame", lambda: db.patients_frame()),
+        Case("read", "get_patient", lambda: db.get_patient(pid())),
+        Case("read", "search_patients", lambda: db.search_patients(name[:3])),
+        Case("read", "search_doctors", lambda: db.search_doctors("a")),
+        Case("read", "list_departments", lambda: db.list_departments()),
+        Case("read", "departments_frame", lambda: db.departments_frame()),
+        Case("read", "get_department", lambda: db.get_department(dep)),
+        Case("read", "list_doctors", lambda: db.list_doctors()),
+        Case("read", "doctors_frame", lambda: db.doctors_frame()),
+        Case("read", "get_doctor", lambda: db.get_doctor(doc)),
+        Case("read", "list_appointments", lambda: db.list_appointments()),
+        Case("read", "list_appointments_page", lambda: db.list_appointments_page()),
+        Case("read", "list_appointments_page(after)", lambda: db.list_appointments_page(after=page_cursor)),
+        Case("read", "list_appointments_page(patient)", lambda: db.list_appointments_page(patient_id=pid())),
+        Case("read", "list_appointments_page(doctor)", lambda: db.list_appointments_page(doctor_id=rng.choice(doctor_ids))),
+        Case("read", "list_appointments_page(status)", lambda: db.list_appointments_page(status="scheduled")),
+        Case("read", "list_appointments_page(history)", lambda: db.list_appointments_page(include_history=True)),
+        Case("read", "appointments_frame", lambda: db.appointments_frame()),
+        Case("read", "archive_stats", lambda: db.archive_stats()),
+        Case("read", "appointments_between(doctor)", lambda: db.appointments_between(*week(), doctor_id=rng.choice(doctor_ids))),
+        Case("read", "appointments_between(department)", lambda: db.appointments_between(*week(), department_id=rng.choice(department_ids))),
+        Case("read", "appointments_between(patient)", lambda: db.appointments_between(*week(), patient_id=pid())),
+        Case("read", "get_appointment", lambda: db.get_appointment(rng.randint(1, max_aid))),
+        Case("read", "find_conflict", lambda: db.find_conflict(rng.choice(doctor_ids), pid(), slot())),
+        Case("read", "next_free_slots", lambda: db.next_free_slots(doctor_id=rng.choice(doctor_ids))),
+        Case("read", "next_free_slots(department)", lambda: db.next_free_slots(department_id=rng.choice(department_ids))),
+        Case("read", "appointments_per_day", lambda: db.appointments_per_day()),
+        Case("read", "appointments_by_department", lambda: db.appointments_by_department()),
+        Case("read", "appointments_by_doctor", lambda: db.appointments_by_doctor()),
+        Case("read", "stats_totals", lambda: db.stats_totals()),
+        Case("read", "iter_export", lambda: sum(len(rows) for _, rows in db.iter_export("appointments_view"))),
+        Case("read", "export_columns", lambda: db.export_columns("appointments_view")),
+        Case("write", "add_patient", lambda: new_patient()),
+        Case("write", "update_patient", lambda p: db.update_patient(p, "Bench", "Updated", None, None, None, None), pid),
+        Case("write", "delete_patient", lambda p: db.delete_patient(p), new_patient),
+        Case("write", "add_patients_bulk", lambda rows: db.add_patients_bulk(rows), lambda: patient_rows(1000), 1000),
+        Case("write", "add_department", lambda: db.add_department(f"Bench {next(counter)}")),
+        Case("write", "update_department", lambda d: db.update_department(d, f"Bench {next(counter)}"), lambda: db.add_department(f"Bench {next(counter)}")),
+        Case("write", "delete_department", lambda d: db.delete_department(d), lambda: db.add_department(f"Bench {next(counter)}")),
+        Case("write", "add_doctor", lambda: db.add_doctor("Bench", "Doctor", dep)),
+        Case("write", "update_doctor", lambda d: db.update_doctor(d, "Bench", "Updated", dep, None), lambda: rng.choice(doctor_ids)),
+        Case("write", "delete_doctor", lambda d: db.delete_doctor(d), lambda: db.add_doctor("Bench", "Doctor", dep)),
+        Case("write", "add_appointment", lambda p: db.add_appointment(p, doc, dep, slot()), pid),
+        Case("write", "add_appointments_bulk", lambda rows: db.add_appointments_bulk(rows), lambda: appointment_rows(1000), 1000),
+        Case("write", "update_appointment", lambda a: db.update_appointment(a, db.get_appointment(a)["patient_id"], None, None, slot(), None, "scheduled", None), new_appointment),
+        Case("write", "delete_appointment", lambda a: db.delete_appointment(a), new_appointment),
+        Case("write", "submit", lambda: db.submit(db.add_patient, "Bench", "Queued").result()),
+        # Steady state: after the first call only the index probe for due rows remains.
+        Case("write", "archive_appointments", lambda: db.archive_appointments()),
+    ]
+
+
+def render_cases() -> List[Case]:
+    """Headless reruns of each page through Streamlit's AppTest, with a cold and a warm read cache."""
+    from streamlit.testing.v1 import AppTest
+
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    cases = []
+    for page, section in (("Home", None), ("Manage", "Patients"), ("Manage", "Doctors"),
+                          ("Manage", "Departments"), ("Manage", "Appointments")):
+        at = AppTest.from_file(app, default_timeout=300)
+        at.run()
+        if page != "Home":
+            at.sidebar.radio[0].set_value(page).run()
+        if section:
+            at.radio(key="m_section").set_value(section).run()
+
+        def render(_=None, at=at):
+            at.run()
+            if at.exception:
+                raise RuntimeError(at.exception[0].value)
+
+        label = "home_page" if page == "Home" else f"manage_page({section})"
+        cases.append(Case("render", f"{label} cold", render, db.clear_cache))
+        cases.append(Case("render", f"{label} warm", render))
+    return cases
+
+
+def unbenchmarked(cases: List[Case]) -> List[str]:
+    """Public db.py functions that no case exercises (by name prefix)."""
+    covered = {c.name.split("(")[0] for c in cases}
+    public = {
+        name for name, fn in vars(db).items()
+        if not name.startswith("_") and inspect.isfunction(fn) and fn.__module__ == "db"
+    }
+    return sorted(public - covered - NOT_BENCHMARKED)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def prepared_db(size: int, data_dir: Optional[str]) -> Optional[str]:
+    """Path of a saved database with `size` appointments, generating it if needed."""
+    if not data_dir:
+        return None
+    path = os.path.join(data_dir, f"hospital-{size}.db")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        with scratch_db(None) as scratch:
+            populate(size)
+            db.close_pool()
+            shutil.copy(scratch, path)
+    return path
+
+
+def run_case(size: int, case: Case, args) -> dict:
+    case.fn(case.setup()) if case.setup else case.fn()  # warm up
+    samples = sample(case, args.budget, args.min_samples, args.max_samples)
+    peak = peak_memory(case)
+    total = sum(samples)
+    row = {
+        "size": size,
+        "group": case.group,
+        "name": case.name,
+        "n": len(samples),
+        "mean_ms": statistics.mean(samples) * 1e3,
+        "p50_ms": percentile(samples, 50) * 1e3,
+        "p95_ms": percentile(samples, 95) * 1e3,
+        "p99_ms": percentile(samples, 99) * 1e3,
+        "ops_per_s": len(samples) / total,
+        "rows_per_s": len(samples) * case.items / total,
+        "peak_kib": peak / 1024,
+    }
+    print(
+        f"{size:>9,} {case.group:>11} {case.name:<36} n={row['n']:<5} "
+        f"p50={row['p50_ms']:9.3f}ms p95={row['p95_ms']:9.3f}ms "
+        f"{row['ops_per_s']:>10,.0f} ops/s peak={row['peak_kib']:,.0f} KiB"
+    )
+    return row
+
+
+def bench_suite(args) -> None:
+    """Time every db.py function and page render at each size; write JSON results."""
+    results = []
+    for size in args.sizes:
+        saved = prepared_db(size, args.data_dir)
+        with scratch_db(saved):
+            if saved is None:
+                t0 = time.perf_counter()
+                populate(size)
+                print(f"generated {size:,} appointments in {time.perf_counter() - t0:.1f}s")
+            # Function timings measure database work, so bypass the read cache.
+            old_cache = db.CACHE_SIZE
+            db.CACHE_SIZE = 0
+            try:
+                cases = function_cases()
+                missing = unbenchmarked(cases)
+                if missing:
+                    print(f"not benchmarked: {', '.join(missing)}")
+                results += [run_case(size, case, args) for case in cases]
+            finally:
+                db.CACHE_SIZE = old_cache
+            # Renders run with the cache, as the app does. They come last:
+            # the app instruments db.py's functions for the profiler.
+            if not args.no_render:
+                results += [run_case(size, case, args) for case in render_cases()]
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "sizes": args.sizes,
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"wrote {len(results)} results to {args.out}")
+
+
+def bench_compare(args) -> None:
+    """Compare p50 latency of two suite result files; fail on regressions."""
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    before: Dict[tuple, dict] = {(r["size"], r["name"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"baseline {baseline['meta'].get('revision')} -> current {current['meta'].get('revision')}")
+    for row in current["results"]:
+        old = before.get((row["size"], row["name"]))
+        if old is None or not old["p50_ms"]:
+            continue
+        ratio = row["p50_ms"] / old["p50_ms"]
+        flag = "REGRESSION" if ratio > args.threshold else ""
+        print(f"{row['size']:>9,} {row['name']:<36} {old['p50_ms']:9.3f}ms -> {row['p50_ms']:9.3f}ms x{ratio:5.2f} {flag}")
+        if flag:
+            regressions.append(row["name"])
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over x{args.threshold}")
+        sys.exit(1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("connections", help="connect-per-call vs pooled connections")
+    p.add_argument("--renders", type=int, default=500)
+    p.set_defaults(func=bench_connections)
+
+    p = sub.add_parser("plans", help="EXPLAIN QUERY PLAN regression check on a large database")
+    p.add_argument("--appointments", type=int, default=200_000)
+    p.set_defaults(func=bench_plans)
+
+    p = sub.add_parser("frames", help="dict rows vs DataFrame/Arrow fetch for the appointments view")
+    p.add_argument("--appointments", type=int, default=100_000)
+    p.set_defaults(func=bench_frames)
+
+    p = sub.add_parser("schedule", help="conflict-check and free-slot latency at scale")
+    p.add_argument("--appointments", type=int, default=1_000_000)
+    p.add_argument("--checks", type=int, default=10_000)
+    p.set_defaults(func=bench_schedule)
+
+    p = sub.add_parser("startup", help="cold import, schema check and first-render time in fresh processes")
+    p.add_argument("--runs", type=int, default=5)
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("readers", help="concurrent reader sessions in several processes, primary vs snapshot reads")
+    p.add_argument("--appointments", type=int, default=100_000)
+    p.add_argument("--processes", type=int, default=4, help="server processes")
+    p.add_argument("--sessions", type=int, default=8, help="browsing sessions (threads) per process")
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--warmup", type=float, default=5.0, help="seconds allowed for the processes to start")
+    p.add_argument("--interval", type=float, default=db.SNAPSHOT_INTERVAL_S, help="snapshot refresh interval")
+    p.add_argument("--modes", type=lambda v: v.split(","), default=["primary", "snapshot"])
+    p.add_argument("--no-writer", dest="writer", action="store_false", help="readers only")
+    p.set_defaults(func=bench_readers)
+
+    p = sub.add_parser("suite", help="time every db.py function and page render at several sizes")
+    p.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=[1_000, 100_000, 1_000_000])
+    p.add_argument("--out", default="bench-results.json")
+    p.add_argument("--data-dir", help="keep generated databases here and reuse them across runs")
+    p.add_argument("--budget", type=float, default=1.0, help="seconds of sampling per case")
+    p.add_argument("--min-samples", type=int, default=3)
+    p.add_argument("--max-samples", type=int, default=1000)
+    p.add_argument("--no-render", action="store_true", help="skip the Streamlit page renders")
+    p.set_defaults(func=bench_suite)
+
+    p = sub.add_parser("compare", help="compare two suite result files")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.add_argument("--threshold", type=float, default=1.25, help="p50 ratio that counts as a regression")
+    p.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,265 +1,2019 @@
+import atexit
+import functools
+import heapq
+import itertools
+import json
+import os
+import queue
+import re
+import shutil
 import sqlite3
-from typing import List, Dict, Any, Optional
-import faker
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from pathlib import Path
+from time import perf_counter
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Mapping, NamedTuple, Sequence, Tuple, Union
 
-DB_PATH = "hospital.db"
+import profiler
+from models import Appointment, Department, Doctor, Patient, Row, row_factory
 
+# Server processes sharing one database can all point at it with HOSPITAL_DB.
+DB_PATH = os.environ.get("HOSPITAL_DB", "hospital.db")
+# Idle connections kept per database file; 0 disables pooling (connect per call).
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+PAGE_SIZE = 50
+# Maximum number of cached read results kept per process.
+CACHE_SIZE = 256
+# Rows per executemany call (and per savepoint) in the *_bulk writers.
+BULK_CHUNK_SIZE = 1000
+# Rows per fetchmany() call when streaming exports.
+EXPORT_CHUNK_SIZE = 10_000
+# Scheduling: appointments without an end_time last DEFAULT_DURATION_MIN,
+# and none may exceed MAX_DURATION_MIN, which bounds the overlap range scan.
+DEFAULT_DURATION_MIN = 30
+MAX_DURATION_MIN = 8 * 60
+SLOT_STEP_MIN = 15
+WORKDAY_START = time(9, 0)
+WORKDAY_END = time(17, 0)
+SEARCH_LIMIT = 20
+# Route add_/update_/delete_ calls through the single writer thread.
+WRITE_QUEUE = True
+# Most queued writes committed together in one transaction.
+WRITE_BATCH_SIZE = 100
+# Archive file attached to every connection as "archive"; None puts it
+# beside DB_PATH as "<name>-archive.db". HOSPITAL_ARCHIVE_DB overrides it.
+ARCHIVE_PATH: Optional[str] = os.environ.get("HOSPITAL_ARCHIVE_DB") or None
+# Appointments that started longer ago than this are moved to the archive.
+ARCHIVE_AFTER_DAYS = 365
+# Appointments moved per copy/delete transaction pair.
+ARCHIVE_BATCH_SIZE = 5000
+# Serve reads from a private read-only copy of DB_PATH instead of the file
+# itself (see Snapshot); writes always go to DB_PATH. HOSPITAL_DB_SNAPSHOT=1
+# turns it on.
+SNAPSHOT_READS = os.environ.get("HOSPITAL_DB_SNAPSHOT", "") not in ("", "0")
+# Seconds between checks for commits to copy into the snapshot.
+SNAPSHOT_INTERVAL_S = float(os.environ.get("HOSPITAL_DB_SNAPSHOT_INTERVAL", "2"))
+# Where snapshot files go (a temporary directory per process inside it);
+# None uses the system temporary directory.
+SNAPSHOT_DIR: Optional[str] = os.environ.get("HOSPITAL_DB_SNAPSHOT_DIR") or None
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES)
+# A keyset cursor: the sort-key values of the last row on the previous page.
+Cursor = Tuple[Any, ...]
+Page = Tuple[List[Row], Optional[Cursor]]
+
+
+_local = threading.local()
+
+
+def query_count() -> int:
+    """Statements executed on the current thread since reset_query_count()."""
+    return getattr(_local, "queries", 0)
+
+
+def reset_query_count() -> None:
+    _local.queries = 0
+
+
+class CountingCursor(sqlite3.Cursor):
+    """Cursor that counts executed statements per thread and times them.
+
+    A statement's profiler record stays open while its rows are fetched,
+    so fetch time and row counts are included; it is closed once the rows
+    are exhausted, on the next execute, or when the cursor goes away.
+    """
+
+    _profile: Optional[profiler.Record] = None
+
+    def _run(self, method, sql, parameters, many):
+        _local.queries = getattr(_local, "queries", 0) + 1
+        profiler.finish(self._profile)
+        self._profile = rec = profiler.start_query(sql, parameters, many)
+        if rec is None:
+            return method(sql, parameters)
+        t0 = perf_counter()
+        try:
+            result = method(sql, parameters)
+        except BaseException:
+            profiler.add(rec, perf_counter() - t0)
+            profiler.finish(rec)
+            raise
+        profiler.add(rec, perf_counter() - t0, max(self.rowcount, 0))
+        return result
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters, False)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters, True)
+
+    def _fetch(self, fetch, *args):
+        rec = self._profile
+        if rec is None or rec.done:
+            return fetch(*args)
+        t0 = perf_counter()
+        result = fetch(*args)
+        profiler.add(rec, perf_counter() - t0)
+        return result
+
+    def fetchone(self):
+        row = self._fetch(super().fetchone)
+        if self._profile is not None:
+            if row is None:
+                profiler.finish(self._profile)
+            else:
+                self._profile.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._fetch(super().fetchmany, size)
+        if self._profile is not None:
+            self._profile.rows += len(rows)
+            if len(rows) < size:
+                profiler.finish(self._profile)
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(super().fetchall)
+        if self._profile is not None:
+            self._profile.rows += len(rows)
+            profiler.finish(self._profile)
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._fetch(super().__next__)
+        except StopIteration:
+            profiler.finish(self._profile)
+            raise
+        if self._profile is not None:
+            self._profile.rows += 1
+        return row
+
+    def close(self):
+        profiler.finish(self._profile)
+        super().close()
+
+    def __del__(self):
+        profiler.finish(self._profile)
+
+
+class Connection(sqlite3.Connection):
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# Same columns as appointments, without the foreign keys (which cannot span
+# database files); the indexes mirror the hot table's so history reads can
+# use the same plans.
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive.appointments (
+  id INTEGER PRIMARY KEY,
+  patient_id INTEGER NOT NULL,
+  doctor_id INTEGER,
+  department_id INTEGER,
+  start_time TEXT NOT NULL,
+  end_time TEXT,
+  status TEXT DEFAULT 'scheduled',
+  reason TEXT,
+  created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS archive.idx_archive_start ON appointments(start_time);
+CREATE INDEX IF NOT EXISTS archive.idx_archive_patient ON appointments(patient_id, start_time);
+CREATE INDEX IF NOT EXISTS archive.idx_archive_doctor ON appointments(doctor_id, start_time);
+CREATE INDEX IF NOT EXISTS archive.idx_archive_department ON appointments(department_id, start_time);
+CREATE INDEX IF NOT EXISTS archive.idx_archive_status ON appointments(status, start_time);
+"""
+
+
+def archive_path(path: Optional[str] = None) -> str:
+    """The archive file for database `path`: ARCHIVE_PATH, or "<name>-archive.db" beside it."""
+    path = path or DB_PATH
+    if ARCHIVE_PATH:
+        return ARCHIVE_PATH
+    if path == ":memory:":
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-archive{ext}"
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    """Open a new connection with the per-connection pragmas applied once.
+
+    The archive is attached first so journal_mode = WAL applies to both files.
+    """
+    conn = sqlite3.connect(
+        path or DB_PATH,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        isolation_level=None,
+        check_same_thread=False,
+        factory=Connection,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT_MS)}")
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path(path),))
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.executescript(ARCHIVE_SCHEMA)
     return conn
 
-def init_db(schema_path: str = "schema.sql") -> None:
-    conn = get_conn()
+
+class ConnectionPool:
+    """Keeps up to `size` idle connections to one database file for reuse.
+
+    Callers beyond `size` still get a connection; it is simply closed on
+    release instead of being kept.
+    """
+
+    def __init__(self, path: str, size: int, opener=None):
+        self.path = path
+        self.size = size
+        self.connects = 0
+        self._opener = opener or connect
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.connects += 1
+        return self._opener(self.path)
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        """Close the idle connections; borrowed ones are closed when released."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.size = 0
+        for conn in idle:
+            conn.close()
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the pool for the current DB_PATH, recreating it if DB_PATH changed."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.path != DB_PATH or _pool.size != POOL_SIZE:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DB_PATH, POOL_SIZE)
+        return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+@contextmanager
+def get_conn() -> Iterator[sqlite3.Connection]:
+    """Borrow a pooled connection for the duration of the block.
+
+    Nested uses on the same thread share the outer connection, so several
+    reads can be batched with `with db.get_conn(): ...`.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+    pool = get_pool()
+    conn = pool.acquire()
+    _local.conn = conn
+    try:
+        yield conn
+    finally:
+        _local.conn = None
+        pool.release(conn)
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Run the block in a write transaction, or a savepoint when nested."""
+    with get_conn() as conn:
+        if conn.in_transaction:
+            conn.execute("SAVEPOINT nested")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK TO nested")
+                conn.execute("RELEASE nested")
+                raise
+            conn.execute("RELEASE nested")
+        else:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            _committed()
+
+
+# Read snapshot
+
+_last_commit = 0.0
+
+
+def _committed() -> None:
+    """Note that this process committed; read_conn() reads the primary until a snapshot includes it."""
+    global _last_commit
+    _last_commit = perf_counter()
+
+
+def _readonly_uri(path: str) -> str:
+    return Path(path).resolve().as_uri() + "?mode=ro&immutable=1"
+
+
+class Snapshot:
+    """A private, read-only copy of the database for read_conn() to serve reads from.
+
+    A background thread copies DB_PATH and its archive with the backup API,
+    inside one read transaction so a row being archived is in exactly one
+    of the two copies. It checks every `interval` seconds and copies only
+    if something was committed since the last copy. Each copy is a new pair of files opened with
+    immutable=1: readers take no locks on them and never touch DB_PATH, so
+    browsing cannot hold up the writer, a checkpoint or another process.
+    A reader keeps the copy it started with; the previous files are
+    removed when a new copy is published.
+    """
+
+    def __init__(self, path: str, interval: float = SNAPSHOT_INTERVAL_S, directory: Optional[str] = SNAPSHOT_DIR):
+        self.path = path
+        self.interval = interval
+        self.refreshes = 0
+        self.errors = 0
+        # perf_counter() when the current copy's read transaction began,
+        # and when it was published.
+        self.taken_at = 0.0
+        self.refreshed_at = 0.0
+        self.copy_ms: deque = deque(maxlen=100)
+        self._dir = tempfile.mkdtemp(prefix="hospital-snapshot-", dir=directory)
+        self._source = connect(path)
+        self._seen: Optional[tuple] = None
+        self._generation = 0
+        self._pool: Optional[ConnectionPool] = None
+        self._files: Tuple[str, ...] = ()
+        self._copy_lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name="db-snapshot", daemon=True)
+        self._thread.start()
+
+    @property
+    def age(self) -> float:
+        """Seconds since the current copy was published."""
+        return perf_counter() - self.refreshed_at
+
+    def refresh(self, force: bool = False) -> bool:
+        """Copy the primary into a new generation if it changed (or `force`); returns whether it did."""
+        with self._copy_lock:
+            src = self._source
+            # data_version changes whenever another connection commits to that file.
+            seen = (src.execute("PRAGMA main.data_version").fetchone()[0], src.execute("PRAGMA archive.data_version").fetchone()[0])
+            if seen == self._seen and not force:
+                return False
+            self._generation += 1
+            main = os.path.join(self._dir, f"{self._generation}.db")
+            archive = os.path.join(self._dir, f"{self._generation}-archive.db")
+            taken_at = perf_counter()
+            src.execute("BEGIN")
+            try:
+                src.execute("SELECT COUNT(*) FROM main.sqlite_master").fetchone()
+                src.execute("SELECT COUNT(*) FROM archive.sqlite_master").fetchone()
+                for name, target in (("main", main), ("archive", archive)):
+                    dst = sqlite3.connect(target)
+                    try:
+                        src.backup(dst, name=name)
+                    finally:
+                        dst.close()
+            finally:
+                src.execute("ROLLBACK")
+            self.copy_ms.append((perf_counter() - taken_at) * 1000)
+            self._seen = seen
+            pool = ConnectionPool(main, POOL_SIZE, opener=functools.partial(self._open, archive=archive))
+            with self._publish_lock:
+                old_pool, old_files = self._pool, self._files
+                self._pool, self._files = pool, (main, archive)
+                self.taken_at, self.refreshed_at = taken_at, perf_counter()
+                self.refreshes += 1
+            if old_pool is not None:
+                old_pool.close()
+            for path in old_files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # still open somewhere that cannot unlink open files; close() cleans up
+            return True
+
+    @staticmethod
+    def _open(path: str, archive: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            _readonly_uri(path),
+            uri=True,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level=None,
+            check_same_thread=False,
+            factory=Connection,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("ATTACH DATABASE ? AS archive", (_readonly_uri(archive),))
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a read-only connection to the current copy."""
+        with self._publish_lock:
+            pool = self._pool
+            conn = pool.acquire()
+        try:
+            yield conn
+        finally:
+            pool.release(conn)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except sqlite3.Error:
+                # Keep serving the previous copy; try again next time.
+                self.errors += 1
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        with self._copy_lock:
+            if self._pool is not None:
+                self._pool.close()
+            self._source.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+_snapshot: Optional[Snapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> Snapshot:
+    """Return the snapshot of the current DB_PATH, taking the first copy on first use."""
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.path != DB_PATH or _snapshot.interval != SNAPSHOT_INTERVAL_S:
+            if _snapshot is not None:
+                _snapshot.close()
+            _snapshot = Snapshot(DB_PATH, SNAPSHOT_INTERVAL_S, SNAPSHOT_DIR)
+        return _snapshot
+
+
+def close_snapshot() -> None:
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is not None:
+            _snapshot.close()
+            _snapshot = None
+
+
+# Snapshot files live outside the project; remove them when the process exits.
+atexit.register(close_snapshot)
+
+
+@contextmanager
+def read_conn() -> Iterator[sqlite3.Connection]:
+    """Borrow a connection for reads: from the snapshot when SNAPSHOT_READS is on.
+
+    Inside get_conn() or transaction() the thread's connection to DB_PATH
+    is used, so reads made by a write see its changes. So is DB_PATH when
+    this process has committed since the snapshot was copied, so a session
+    sees its own writes straight away. Nested uses share one connection.
+    """
+    if not SNAPSHOT_READS or getattr(_local, "conn", None) is not None:
+        with get_conn() as conn:
+            yield conn
+        return
+    conn = getattr(_local, "read_conn", None)
+    if conn is not None:
+        yield conn
+        return
+    snapshot = get_snapshot()
+    if snapshot.taken_at < _last_commit:
+        with get_conn() as conn:
+            yield conn
+        return
+    with snapshot.connection() as conn:
+        _local.read_conn = conn
+        try:
+            yield conn
+        finally:
+            _local.read_conn = None
+
+
+def snapshot_stats() -> Dict[str, Any]:
+    """Whether reads use a snapshot, its age and how long recent copies took."""
+    snapshot = _snapshot
+    if not SNAPSHOT_READS or snapshot is None:
+        return {"enabled": SNAPSHOT_READS, "refreshes": 0}
+    stats = {
+        "enabled": True,
+        "refreshes": snapshot.refreshes,
+        "errors": snapshot.errors,
+        "age_s": snapshot.age,
+        "interval_s": snapshot.interval,
+    }
+    copy_ms = list(snapshot.copy_ms)
+    if copy_ms:
+        stats["copy_p50_ms"] = profiler.percentile(copy_ms, 50)
+        stats["copy_max_ms"] = max(copy_ms)
+    return stats
+
+
+# Write queue
+
+class _Write(NamedTuple):
+    fn: Any
+    args: tuple
+    kwargs: dict
+    batch: bool
+    future: Future
+    queued_at: float
+
+
+class WriteQueue:
+    """A single writer thread applying queued writes over one connection.
+
+    Sessions never contend for SQLite's write lock with each other: their
+    writes wait in the queue instead. Whatever is waiting when the writer
+    becomes free (up to `batch_size`) is applied in one transaction, each
+    write in its own savepoint so a failing one (e.g. a scheduling
+    conflict) does not undo the rest. Futures resolve after the COMMIT.
+    Writes submitted with batch=False, like the bulk importers that
+    manage their own chunking, run alone.
+
+    If the thread dies (say the database cannot be opened), every waiting
+    and later write fails with the error that stopped it instead of
+    blocking its caller forever; get_writer() then starts a new writer.
+    """
+
+    def __init__(self, path: str, batch_size: int = WRITE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.submitted = 0
+        self.committed = 0
+        self.failed = 0
+        self.batches = 0
+        # Recent COMMIT durations and submit-to-result latencies, in ms.
+        self.commit_ms: deque = deque(maxlen=1000)
+        self.latency_ms: deque = deque(maxlen=1000)
+        self._queue: "queue.Queue[Optional[_Write]]" = queue.Queue()
+        self._held: Optional[_Write] = None
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def alive(self) -> bool:
+        return self._thread.is_alive() and self._error is None
+
+    def submit(self, fn, *args, batch: bool = True, **kwargs) -> Future:
+        future: Future = Future()
+        with self._lock:
+            self.submitted += 1
+            if self._error is not None:
+                self.failed += 1
+                future.set_exception(self._error)
+                return future
+            # Under the lock so _fail() either sees this write or it sees the error.
+            self._queue.put(_Write(fn, args, kwargs, batch, future, perf_counter()))
+        return future
+
+    def close(self) -> None:
+        """Apply everything already queued, then stop the thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self) -> Optional[List[_Write]]:
+        first, self._held = self._held or self._queue.get(), None
+        if first is None or not first.batch:
+            return None if first is None else [first]
+        items = [first]
+        while len(items) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # stop after this batch
+                break
+            if not item.batch:
+                self._held = item
+                break
+            items.append(item)
+        return items
+
+    def _run(self) -> None:
+        conn = None
+        items: List[_Write] = []
+        try:
+            conn = connect(self.path)
+            # Write functions called here find this connection via get_conn().
+            _local.conn = conn
+            while True:
+                items = self._next_batch()
+                if items is None:
+                    break
+                if items[0].batch:
+                    self._apply_batch(conn, items)
+                else:
+                    self._apply_alone(conn, items[0])
+        except BaseException as exc:
+            # Reported to the callers through their futures.
+            self._fail(items, exc)
+        finally:
+            _local.conn = None
+            if conn is not None:
+                conn.close()
+
+    def _fail(self, current: List[_Write], error: BaseException) -> None:
+        """Fail the writes in flight and every queued write with `error`."""
+        with self._lock:
+            self._error = error
+            pending = list(current) + [self._held]
+            self._held = None
+            while True:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+        for item in pending:
+            if item is not None and not item.future.done():
+                self._resolve(item, error=error)
+
+    def _resolve(self, item: _Write, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if error is None:
+                self.committed += 1
+            else:
+                self.failed += 1
+            self.latency_ms.append((perf_counter() - item.queued_at) * 1000)
+        if error is None:
+            item.future.set_result(result)
+        else:
+            item.future.set_exception(error)
+
+    def _apply_alone(self, conn: sqlite3.Connection, item: _Write) -> None:
+        try:
+            result = item.fn(*item.args, **item.kwargs)
+        except Exception as exc:
+            self._resolve(item, error=exc)
+        else:
+            self._resolve(item, result)
+        finally:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+
+    def _apply_batch(self, conn: sqlite3.Connection, items: List[_Write]) -> None:
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for item in items:
+                conn.execute("SAVEPOINT queued")
+                try:
+                    result = item.fn(*item.args, **item.kwargs)
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO queued")
+                    outcomes.append((item, None, exc))
+                else:
+                    outcomes.append((item, result, None))
+                conn.execute("RELEASE queued")
+            t0 = perf_counter()
+            conn.execute("COMMIT")
+            _committed()
+        except sqlite3.Error as exc:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for item in items:
+                self._resolve(item, error=exc)
+            return
+        with self._lock:
+            self.batches += 1
+            self.commit_ms.append((perf_counter() - t0) * 1000)
+        for item, result, error in outcomes:
+            self._resolve(item, result, error)
+
+
+_writer: Optional[WriteQueue] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> WriteQueue:
+    """Return the writer for the current DB_PATH, starting it on first use."""
+    global _writer
+    with _writer_lock:
+        if (
+            _writer is None
+            or not _writer.alive
+            or _writer.path != DB_PATH
+            or _writer.batch_size != max(1, WRITE_BATCH_SIZE)
+        ):
+            if _writer is not None:
+                _writer.close()
+            _writer = WriteQueue(DB_PATH, WRITE_BATCH_SIZE)
+        return _writer
+
+
+def close_writer() -> None:
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+
+def submit(fn, *args, **kwargs) -> Future:
+    """Queue a db write function call; the Future resolves to its return value once committed."""
+    return get_writer().submit(getattr(fn, "write_fn", fn), *args, batch=getattr(fn, "write_batch", True), **kwargs)
+
+
+def write_stats() -> Dict[str, Any]:
+    """Queue depth, write counts and recent commit/latency percentiles of the writer."""
+    writer = _writer
+    if writer is None:
+        return {"depth": 0, "submitted": 0, "committed": 0, "failed": 0, "batches": 0}
+    with writer._lock:
+        commit_ms, latency_ms = list(writer.commit_ms), list(writer.latency_ms)
+        stats = {
+            "depth": writer.depth,
+            "submitted": writer.submitted,
+            "committed": writer.committed,
+            "failed": writer.failed,
+            "batches": writer.batches,
+        }
+    if stats["batches"]:
+        stats["writes_per_batch"] = (stats["committed"] + stats["failed"]) / stats["batches"]
+    for name, samples in (("commit", commit_ms), ("latency", latency_ms)):
+        if samples:
+            stats[f"{name}_p50_ms"] = profiler.percentile(samples, 50)
+            stats[f"{name}_p95_ms"] = profiler.percentile(samples, 95)
+    return stats
+
+
+def queued(fn=None, *, batch: bool = True):
+    """Send calls to a write function through the writer thread and wait for the result.
+
+    Calls made while the thread already holds a connection (inside
+    get_conn() or transaction(), or on the writer itself) run directly,
+    so composed writes stay in the caller's transaction.
+    """
+    if fn is None:
+        return functools.partial(queued, batch=batch)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not WRITE_QUEUE or getattr(_local, "conn", None) is not None:
+            return fn(*args, **kwargs)
+        return get_writer().submit(fn, *args, batch=batch, **kwargs).result()
+
+    wrapper.write_fn = fn
+    wrapper.write_batch = batch
+    return wrapper
+
+
+_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def table_versions(conn: sqlite3.Connection, tables: Sequence[str]) -> Tuple[int, ...]:
+    """Current change counters for `tables`, as maintained by schema.sql triggers."""
+    versions = dict(conn.execute("SELECT name, version FROM table_versions").fetchall())
+    return tuple(versions.get(t, 0) for t in tables)
+
+
+def cached(*tables: str):
+    """Cache a read function's result until any of `tables` is written to.
+
+    Results are shared between callers and sessions, so treat them as
+    read-only. Freshness is checked against the table_versions counters,
+    which also see writes from other processes using the same database.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (DB_PATH, fn.__name__, args, tuple(sorted(kwargs.items())))
+            with read_conn() as conn:
+                try:
+                    versions = table_versions(conn, tables)
+                except sqlite3.OperationalError:
+                    # Database predates the table_versions table; don't cache.
+                    return fn(*args, **kwargs)
+                with _cache_lock:
+                    hit = _cache.get(key)
+                    if hit is not None and hit[0] == versions:
+                        _cache.move_to_end(key)
+                        return hit[1]
+                result = fn(*args, **kwargs)
+            with _cache_lock:
+                _cache[key] = (versions, result)
+                _cache.move_to_end(key)
+                while len(_cache) > CACHE_SIZE:
+                    _cache.popitem(last=False)
+            return result
+        return wrapper
+    return decorator
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
+def _keyset_sql(
+    select: Union[str, Sequence[str]],
+    keys: Sequence[str],
+    where: List[str],
+    params: List[Any],
+    after: Optional[Cursor],
+    limit: Optional[int],
+    descending: bool = True,
+) -> Tuple[str, List[Any]]:
+    """Build a query ordered by `keys` that starts strictly after `after`.
+
+    One extra row past `limit` is requested so callers can tell whether a
+    next page exists; `limit=None` fetches everything. `select` may also
+    be a list of SELECTs with the same columns (hot and archived
+    appointments): each gets the filters and SQLite merges their ordered
+    results, so every one still pages through its own index.
+    """
+    arms = [select] if isinstance(select, str) else list(select)
+    where = list(where)
+    params = list(params)
+    direction = "DESC" if descending else "ASC"
+    if after is not None:
+        op = "<" if descending else ">"
+        where.append(f"({', '.join(keys)}) {op} ({', '.join('?' for _ in keys)})")
+        params.extend(after)
+    clause = " WHERE " + " AND ".join(where) if where else ""
+    sql = " UNION ALL ".join(arm + clause for arm in arms)
+    params = params * len(arms)
+    if len(arms) > 1:
+        # A compound SELECT is ordered by result column names.
+        keys = [k.rsplit(".", 1)[-1] for k in keys]
+    sql += " ORDER BY " + ", ".join(f"{k} {direction}" for k in keys)
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    return sql, params
+
+
+def _keyset_page(
+    conn: sqlite3.Connection,
+    model,
+    select: Union[str, Sequence[str]],
+    keys: Sequence[str],
+    where: List[str],
+    params: List[Any],
+    after: Optional[Cursor],
+    limit: int,
+    descending: bool = True,
+) -> Page:
+    """Fetch one page of `model` rows plus the cursor for the next page (None on the last page)."""
+    sql, params = _keyset_sql(select, keys, where, params, after, limit, descending)
+    rows = _fetch_rows(conn, model, sql, params)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, tuple(getattr(last, k.rsplit(".", 1)[-1]) for k in keys)
+
+
+def _fetch_rows(conn: sqlite3.Connection, model, sql: str, params: Sequence[Any] = ()) -> List[Row]:
+    """Run a query and build a `model` instance per row (see models.row_factory)."""
+    cur = conn.execute(sql, params)
+    cur.row_factory = row_factory(model, cur.description)
+    return cur.fetchall()
+
+
+def _fetch_row(conn: sqlite3.Connection, model, sql: str, params: Sequence[Any] = ()) -> Optional[Row]:
+    cur = conn.execute(sql, params)
+    cur.row_factory = row_factory(model, cur.description)
+    return cur.fetchone()
+
+
+def _fetch_columns(conn: sqlite3.Connection, sql: str, params: Sequence[Any] = ()) -> Tuple[List[str], List[tuple]]:
+    """Run a query returning plain tuples, skipping the sqlite3.Row factory."""
+    cur = conn.cursor()
+    cur.row_factory = None
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    return [c[0] for c in cur.description], rows
+
+
+def _to_frame(columns: List[str], rows: List[tuple]):
+    import pandas as pd
+
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+
+def fetch_frame(sql: str, params: Sequence[Any] = ()):
+    """Run a read query and return a pandas DataFrame."""
+    with read_conn() as conn:
+        return _to_frame(*_fetch_columns(conn, sql, params))
+
+
+def fetch_arrow(sql: str, params: Sequence[Any] = ()):
+    """Run a read query and return a pyarrow Table built column by column."""
+    import pyarrow as pa
+
+    with read_conn() as conn:
+        columns, rows = _fetch_columns(conn, sql, params)
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    return pa.table({name: pa.array(col) for name, col in zip(columns, values)})
+
+
+def _keyset_frame(
+    conn: sqlite3.Connection,
+    select: Union[str, Sequence[str]],
+    keys: Sequence[str],
+    where: List[str],
+    params: List[Any],
+    after: Optional[Cursor],
+    limit: Optional[int],
+    descending: bool = True,
+):
+    """DataFrame counterpart of _keyset_page; returns (frame, next cursor)."""
+    sql, params = _keyset_sql(select, keys, where, params, after, limit, descending)
+    columns, rows = _fetch_columns(conn, sql, params)
+    cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        positions = [columns.index(k.rsplit(".", 1)[-1]) for k in keys]
+        cursor = tuple(rows[-1][i] for i in positions)
+    return _to_frame(columns, rows), cursor
+
+
+class BulkResult(NamedTuple):
+    inserted: int
+    # (index of the row in the input, error message)
+    errors: List[Tuple[int, str]]
+
+
+def _insert_bulk(
+    sql: str,
+    columns: Sequence[str],
+    rows: Iterable[Mapping[str, Any]],
+    chunk_size: int,
+    validate=None,
+    start_index: int = 0,
+) -> BulkResult:
+    """Insert mapping rows with executemany in one transaction, a savepoint per chunk.
+
+    `validate(conn, chunk)` may return {position in chunk: message} for rows
+    to reject up front, and may replace rows in `chunk` with normalised
+    copies. A chunk that still fails is replayed row by row so
+    only the offending rows are reported and the rest are kept.
+    """
+    inserted = 0
+    errors: List[Tuple[int, str]] = []
+    rows = iter(rows)
+    index = start_index
+    with transaction() as conn:
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            rejected = validate(conn, chunk) if validate else {}
+            params = []
+            for pos, row in enumerate(chunk):
+                if pos in rejected:
+                    errors.append((index + pos, rejected[pos]))
+                else:
+                    params.append((index + pos, tuple(row.get(c) for c in columns)))
+            index += len(chunk)
+            try:
+                with transaction():
+                    conn.executemany(sql, [p for _, p in params])
+                inserted += len(params)
+            except sqlite3.Error:
+                for i, p in params:
+                    try:
+                        with transaction():
+                            conn.execute(sql, p)
+                        inserted += 1
+                    except sqlite3.Error as exc:
+                        errors.append((i, str(exc)))
+    errors.sort()
+    return BulkResult(inserted, errors)
+
+
+# Statements that empty each group of trigger-maintained tables. The
+# schema's backfill statements then refill them from the base tables.
+DERIVED_TABLES = {
+    "search": (
+        "INSERT INTO patients_fts (patients_fts) VALUES ('delete-all')",
+        "INSERT INTO doctors_fts (doctors_fts) VALUES ('delete-all')",
+    ),
+    "stats": (
+        "DELETE FROM stats_daily",
+        "DELETE FROM stats_by_department",
+        "DELETE FROM stats_by_doctor",
+        "DELETE FROM stats_totals",
+    ),
+}
+
+
+def apply_schema(schema_path: str = "schema.sql", rebuild: Sequence[str] = ()) -> None:
+    """Create any missing tables and indexes; existing rows are untouched.
+
+    `rebuild` names DERIVED_TABLES groups to empty and refill in the same
+    transaction, so readers never see them half-built.
+    """
     with open(schema_path, "r") as f:
-        conn.executescript(f.read())
-    
-    fake = faker.Faker()
-    # Insert sample departments
-    departments = ["Cardiology", "Neurology", "Pediatrics", "Oncology", "Emergency"]
-    for dept in departments:
-        conn.execute("INSERT OR IGNORE INTO departments (name) VALUES (?)", (dept,))
-
-    # Insert sample doctors
-    for _ in range(10):
-        first_name = fake.first_name()
-        last_name = fake.last_name()
-        department_id = conn.execute("SELECT id FROM departments ORDER BY RANDOM() LIMIT 1").fetchone()[0]
-        email = fake.email()
-        conn.execute(
-            "INSERT INTO doctors (first_name, last_name, department_id, email) VALUES (?, ?, ?, ?)",
-            (first_name, last_name, department_id, email),
+        script = f.read()
+    resets = [sql for group in rebuild for sql in DERIVED_TABLES[group]]
+    if resets:
+        # Cached reads of derived tables are keyed on the base table versions.
+        resets.append("UPDATE table_versions SET version = version + 1")
+    # Dedicated connection: the schema script sets pragmas that should not
+    # leak into pooled connections.
+    conn = connect()
+    try:
+        conn.executescript("BEGIN IMMEDIATE;\n" + "".join(f"{sql};\n" for sql in resets) + script + "\nCOMMIT;")
+        _committed()
+    finally:
+        conn.close()
+
+
+def rebuild_search_index(schema_path: str = "schema.sql") -> None:
+    """Repopulate the FTS tables, e.g. after a bulk load with triggers disabled."""
+    apply_schema(schema_path, rebuild=("search",))
+
+
+def rebuild_stats(schema_path: str = "schema.sql") -> None:
+    """Recompute the dashboard aggregates from the appointments and patients tables."""
+    apply_schema(schema_path, rebuild=("stats",))
+
+
+def rebuild_derived(schema_path: str = "schema.sql") -> None:
+    """Rebuild every trigger-maintained table from the base tables."""
+    apply_schema(schema_path, rebuild=tuple(DERIVED_TABLES))
+
+
+# Schema versions. schema.sql always describes the current schema and is
+# safe to re-run; append a step here whenever it changes. A step's SQL runs
+# before schema.sql on databases older than that step, for changes that
+# CREATE ... IF NOT EXISTS cannot make (ALTER TABLE, data fixes). A new
+# database gets schema.sql alone.
+# Rewrites appointment times stored as "YYYY-MM-DD HH:MM:SS[.ffffff]" (older
+# imports and seeds) in the YYYY-MM-DDTHH:MM:SS form the scheduling and
+# range queries compare as text. Intervals longer than MAX_DURATION_MIN
+# are cut to that length, or the overlap range scan could not see them,
+# and end times not after the start are cleared (the default duration
+# applies). Unparseable values are left as they are.
+_CANONICAL_TIMES = """
+UPDATE {table} SET
+  start_time = COALESCE(strftime('%Y-%m-%dT%H:%M:%S', start_time), start_time),
+  end_time = COALESCE(strftime('%Y-%m-%dT%H:%M:%S', end_time), end_time)
+WHERE start_time != strftime('%Y-%m-%dT%H:%M:%S', start_time)
+   OR end_time != strftime('%Y-%m-%dT%H:%M:%S', end_time);
+UPDATE {table} SET end_time = CASE
+    WHEN end_time <= start_time THEN NULL
+    ELSE strftime('%Y-%m-%dT%H:%M:%S', start_time, '+{max_minutes} minutes')
+  END
+WHERE end_time <= start_time
+   OR end_time > strftime('%Y-%m-%dT%H:%M:%S', start_time, '+{max_minutes} minutes')
+"""
+
+MIGRATIONS: Tuple[Tuple[int, str, str], ...] = (
+    (1, "patients, doctors, departments, appointments, indexes and table_versions", ""),
+    (2, "full-text search: patients_fts, doctors_fts", ""),
+    (3, "dashboard statistics: stats_* tables", ""),
+    (4, "appointment times as YYYY-MM-DDTHH:MM:SS, at most MAX_DURATION_MIN long", ";\n".join(
+        _CANONICAL_TIMES.format(table=table, max_minutes=MAX_DURATION_MIN)
+        for table in ("appointments", "archive.appointments")
+    )),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+  version INTEGER PRIMARY KEY,
+  name TEXT NOT NULL,
+  applied_at TEXT DEFAULT (datetime('now'))
+)"""
+
+_migrated = set()
+_migrated_lock = threading.Lock()
+
+
+def _schema_version(conn: sqlite3.Connection) -> int:
+    try:
+        return conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        # Created before schema versions were tracked (or empty).
+        return 0
+
+
+def schema_version() -> int:
+    """The latest migration applied to the database; 0 if none are recorded."""
+    with get_conn() as conn:
+        return _schema_version(conn)
+
+
+def migrate(schema_path: str = "schema.sql") -> List[int]:
+    """Apply pending MIGRATIONS, then schema.sql, in one transaction; returns the versions applied.
+
+    An up-to-date database costs one query. Never adds data. If another
+    process migrates the same file at the same time, this transaction
+    fails on the version rows, rolls back and finds the work done.
+    """
+    conn = connect()
+    try:
+        current = _schema_version(conn)
+        pending = [m for m in MIGRATIONS if m[0] > current]
+        if not pending:
+            return []
+        fresh = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'appointments'").fetchone() is None
+        with open(schema_path, "r") as f:
+            script = f.read()
+        stamps = "".join(
+            "INSERT INTO schema_migrations (version, name) VALUES ({}, '{}');\n".format(version, name.replace("'", "''"))
+            for version, name, _ in pending
         )
+        steps = "" if fresh else "".join(f"{sql};\n" for _, _, sql in pending if sql)
+        try:
+            conn.executescript(f"BEGIN IMMEDIATE;\n{_MIGRATIONS_TABLE};\n{stamps}{steps}{script}\nCOMMIT;")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            if _schema_version(conn) < SCHEMA_VERSION:
+                raise
+            return []
+        _committed()
+        return [version for version, _, _ in pending]
+    finally:
+        conn.close()
 
-    # Insert sample patients
-    for _ in range(20):
-        first_name = fake.first_name()
-        last_name = fake.last_name()
-        dob = fake.date_of_birth(minimum_age=0, maximum_age=90).isoformat()
-        gender = fake.random_element(elements=("Male", "Female"))
-        phone = fake.phone_number()
-        email = fake.email()
-        conn.execute(
+
+def ensure_schema(schema_path: str = "schema.sql") -> None:
+    """migrate() the current DB_PATH once per process; later calls return immediately."""
+    if DB_PATH in _migrated:
+        return
+    with _migrated_lock:
+        if DB_PATH not in _migrated:
+            migrate(schema_path)
+            _migrated.add(DB_PATH)
+
+
+def init_db(schema_path: str = "schema.sql") -> bool:
+    """Migrate the schema and add sample data if there are no patients yet; returns whether it did.
+
+    faker and numpy (through seed) are only imported here.
+    """
+    migrate(schema_path)
+    with get_conn() as conn:
+        if conn.execute("SELECT 1 FROM patients LIMIT 1").fetchone():
+            return False
+    import seed
+
+    conn = connect()
+    try:
+        seed.generate(conn)
+    finally:
+        # seed commits on its own connection, outside transaction().
+        _committed()
+        conn.close()
+    return True
+
+
+# Patients
+
+@queued
+def add_patient(first_name: str, last_name: str, dob: Optional[str] = None, gender: Optional[str] = None, phone: Optional[str] = None, email: Optional[str] = None) -> int:
+    with transaction() as conn:
+        cur = conn.execute(
             "INSERT INTO patients (first_name, last_name, dob, gender, phone, email) VALUES (?, ?, ?, ?, ?, ?)",
             (first_name, last_name, dob, gender, phone, email),
         )
-    
-    # Insert sample appointments
-    patient_ids = [row["id"] for row in conn.execute("SELECT id FROM patients").fetchall()]
-    doctor_ids = [row["id"] for row in conn.execute("SELECT id FROM doctors").fetchall()]
-    department_ids = [row["id"] for row in conn.execute("SELECT id FROM departments").fetchall()]
-
-    for _ in range(30):
-        patient_id = fake.random_element(elements=patient_ids)
-        doctor_id = fake.random_element(elements=doctor_ids)
-        department_id = fake.random_element(elements=department_ids)
-        start_time = fake.date_time_between(start_date='-30d')
-        end_time = fake.date_time_between(start_date=start_time).isoformat()
-        reason = fake.sentence(nb_words=6)
-        conn.execute(
-            "INSERT INTO appointments (patient_id, doctor_id, department_id, start_time, end_time, reason) VALUES (?, ?, ?, ?, ?, ?)",
-            (patient_id, doctor_id, department_id, start_time, end_time, reason),
-        )
+        return cur.lastrowid
 
-    conn.commit()
-    conn.close()
 
+@cached("patients")
+def list_patients() -> List[Patient]:
+    with read_conn() as conn:
+        return _fetch_rows(conn, Patient, "SELECT * FROM patients ORDER BY created_at DESC")
 
-# Patients
 
-def add_patient(first_name: str, last_name: str, dob: Optional[str] = None, gender: Optional[str] = None, phone: Optional[str] = None, email: Optional[str] = None) -> int:
-    conn = get_conn()
-    cur = conn.execute(
-        "INSERT INTO patients (first_name, last_name, dob, gender, phone, email) VALUES (?, ?, ?, ?, ?, ?)",
-        (first_name, last_name, dob, gender, phone, email),
-    )
-    conn.commit()
-    pid = cur.lastrowid
-    conn.close()
-    return pid
+def _patient_filters(name: Optional[str]) -> Tuple[List[str], List[Any]]:
+    # The name filter goes through patients_fts, so the plan starts from
+    # the matching rowids and sorts those, rather than walking
+    # idx_patients_created_at and testing every patient on the way.
+    where, params = [], []
+    if name:
+        match = _match_expression(name)
+        if match is None:
+            where.append("0")
+        else:
+            where.append("id IN (SELECT rowid FROM patients_fts WHERE patients_fts MATCH ?)")
+            params.append(f"name : ({match})")
+    return where, params
+
+
+@cached("patients")
+def list_patients_page(limit: int = PAGE_SIZE, after: Optional[Cursor] = None, name: Optional[str] = None) -> Page:
+    """Newest patients first, keyset-paginated on (created_at, id).
+
+    `name` keeps patients with a first- or last-name word starting with
+    each word of `name`.
+    """
+    where, params = _patient_filters(name)
+    with read_conn() as conn:
+        return _keyset_page(conn, Patient, "SELECT * FROM patients", ("created_at", "id"), where, params, after, limit)
 
 
-def list_patients() -> List[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.execute("SELECT * FROM patients ORDER BY created_at DESC")
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
-    return rows
+@cached("patients")
+def patients_frame(limit: Optional[int] = PAGE_SIZE, after: Optional[Cursor] = None, name: Optional[str] = None):
+    """DataFrame version of list_patients_page; `limit=None` returns every patient."""
+    where, params = _patient_filters(name)
+    with read_conn() as conn:
+        return _keyset_frame(conn, "SELECT * FROM patients", ("created_at", "id"), where, params, after, limit)
 
 
-def get_patient(patient_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.execute("SELECT * FROM patients WHERE id = ?", (patient_id,))
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+def get_patient(patient_id: int) -> Optional[Patient]:
+    with read_conn() as conn:
+        return _fetch_row(conn, Patient, "SELECT * FROM patients WHERE id = ?", (patient_id,))
 
 
+@queued
 def update_patient(patient_id: int, first_name: str, last_name: str, dob: Optional[str], gender: Optional[str], phone: Optional[str], email: Optional[str]) -> None:
-    conn = get_conn()
-    conn.execute(
-        "UPDATE patients SET first_name = ?, last_name = ?, dob = ?, gender = ?, phone = ?, email = ? WHERE id = ?",
-        (first_name, last_name, dob, gender, phone, email, patient_id),
-    )
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE patients SET first_name = ?, last_name = ?, dob = ?, gender = ?, phone = ?, email = ? WHERE id = ?",
+            (first_name, last_name, dob, gender, phone, email, patient_id),
+        )
 
 
+@queued
 def delete_patient(patient_id: int) -> None:
-    conn = get_conn()
-    conn.execute("DELETE FROM patients WHERE id = ?", (patient_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("DELETE FROM patients WHERE id = ?", (patient_id,))
+
+
+PATIENT_COLUMNS = ("first_name", "last_name", "dob", "gender", "phone", "email")
+
+
+def _validate_patients(conn: sqlite3.Connection, chunk: List[Mapping[str, Any]]) -> Dict[int, str]:
+    return {
+        pos: "first_name and last_name are required"
+        for pos, row in enumerate(chunk)
+        if not row.get("first_name") or not row.get("last_name")
+    }
+
+
+@queued(batch=False)
+def add_patients_bulk(rows: Iterable[Mapping[str, Any]], chunk_size: int = BULK_CHUNK_SIZE, start_index: int = 0) -> BulkResult:
+    """Insert many patients (mappings keyed by PATIENT_COLUMNS) in one transaction."""
+    return _insert_bulk(
+        "INSERT INTO patients (first_name, last_name, dob, gender, phone, email) VALUES (?, ?, ?, ?, ?, ?)",
+        PATIENT_COLUMNS, rows, chunk_size, _validate_patients, start_index,
+    )
 
 
 # Departments
 
+@queued
 def add_department(name: str) -> int:
-    conn = get_conn()
-    cur = conn.execute("INSERT OR IGNORE INTO departments (name) VALUES (?)", (name,))
-    conn.commit()
-    # If it was ignored, fetch the id
-    if cur.lastrowid:
-        did = cur.lastrowid
-    else:
-        did = conn.execute("SELECT id FROM departments WHERE name = ?", (name,)).fetchone()[0]
-    conn.close()
-    return did
-
-
-def list_departments() -> List[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.execute("SELECT * FROM departments ORDER BY name")
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
-    return rows
-
-
-def get_department(department_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.execute("SELECT * FROM departments WHERE id = ?", (department_id,))
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    with transaction() as conn:
+        cur = conn.execute("INSERT OR IGNORE INTO departments (name) VALUES (?)", (name,))
+        # If it was ignored, fetch the id
+        if cur.rowcount:
+            return cur.lastrowid
+        return conn.execute("SELECT id FROM departments WHERE name = ?", (name,)).fetchone()[0]
+
+
+@cached("departments")
+def list_departments() -> List[Department]:
+    with read_conn() as conn:
+        return _fetch_rows(conn, Department, "SELECT * FROM departments ORDER BY name")
+
+
+@cached("departments")
+def departments_frame():
+    return fetch_frame("SELECT * FROM departments ORDER BY name")
+
 
+def get_department(department_id: int) -> Optional[Department]:
+    with read_conn() as conn:
+        return _fetch_row(conn, Department, "SELECT * FROM departments WHERE id = ?", (department_id,))
 
+
+@queued
 def update_department(department_id: int, name: str) -> None:
-    conn = get_conn()
-    conn.execute("UPDATE departments SET name = ? WHERE id = ?", (name, department_id))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("UPDATE departments SET name = ? WHERE id = ?", (name, department_id))
 
 
+@queued
 def delete_department(department_id: int) -> None:
-    conn = get_conn()
-    conn.execute("DELETE FROM departments WHERE id = ?", (department_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("DELETE FROM departments WHERE id = ?", (department_id,))
 
 
 # Doctors
 
+@queued
 def add_doctor(first_name: str, last_name: str, department_id: Optional[int] = None, email: Optional[str] = None) -> int:
-    conn = get_conn()
-    cur = conn.execute(
-        "INSERT INTO doctors (first_name, last_name, department_id, email) VALUES (?, ?, ?, ?)",
-        (first_name, last_name, department_id, email),
-    )
-    conn.commit()
-    did = cur.lastrowid
-    conn.close()
-    return did
+    with transaction() as conn:
+        cur = conn.execute(
+            "INSERT INTO doctors (first_name, last_name, department_id, email) VALUES (?, ?, ?, ?)",
+            (first_name, last_name, department_id, email),
+        )
+        return cur.lastrowid
 
 
-def list_doctors() -> List[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.execute(
+@cached("doctors", "departments")
+def list_doctors() -> List[Doctor]:
+    with read_conn() as conn:
+        return _fetch_rows(
+            conn, Doctor,
+            "SELECT d.*, dep.name as department_name FROM doctors d LEFT JOIN departments dep ON d.department_id = dep.id ORDER BY d.last_name",
+        )
+
+
+@cached("doctors", "departments")
+def doctors_frame():
+    return fetch_frame(
         "SELECT d.*, dep.name as department_name FROM doctors d LEFT JOIN departments dep ON d.department_id = dep.id ORDER BY d.last_name"
     )
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
-    return rows
 
 
-def get_doctor(doctor_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.execute("SELECT * FROM doctors WHERE id = ?", (doctor_id,))
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+def get_doctor(doctor_id: int) -> Optional[Doctor]:
+    with read_conn() as conn:
+        return _fetch_row(conn, Doctor, "SELECT * FROM doctors WHERE id = ?", (doctor_id,))
 
 
+@queued
 def update_doctor(doctor_id: int, first_name: str, last_name: str, department_id: Optional[int], email: Optional[str]) -> None:
-    conn = get_conn()
-    conn.execute(
-        "UPDATE doctors SET first_name = ?, last_name = ?, department_id = ?, email = ? WHERE id = ?",
-        (first_name, last_name, department_id, email, doctor_id),
-    )
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE doctors SET first_name = ?, last_name = ?, department_id = ?, email = ? WHERE id = ?",
+            (first_name, last_name, department_id, email, doctor_id),
+        )
 
 
+@queued
 def delete_doctor(doctor_id: int) -> None:
-    conn = get_conn()
-    conn.execute("DELETE FROM doctors WHERE id = ?", (doctor_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("DELETE FROM doctors WHERE id = ?", (doctor_id,))
+
+
+# Search
+
+def _match_expression(text: str) -> Optional[str]:
+    """Turn free text into an FTS5 query in which every word is a prefix term."""
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{w}"*' for w in words) or None
+
+
+def _search(model, fts: str, select: str, query: str, limit: int, fallback: str) -> List[Row]:
+    match = _match_expression(query)
+    if match is None:
+        return []
+    with read_conn() as conn:
+        try:
+            return _fetch_rows(conn, model, f"{select} WHERE {fts} MATCH ? ORDER BY {fts}.rank LIMIT ?", (match, limit))
+        except sqlite3.OperationalError:
+            # Database predates the FTS tables: plain prefix match on the name.
+            return _fetch_rows(conn, model, fallback, (f"{query.strip()}%", f"{query.strip()}%", limit))
+
+
+@cached("patients")
+def search_patients(query: str, limit: int = SEARCH_LIMIT) -> List[Patient]:
+    """Patients whose name, email or phone contain every word of `query` as a prefix, best match first."""
+    return _search(
+        Patient,
+        "patients_fts",
+        "SELECT p.* FROM patients_fts JOIN patients p ON p.id = patients_fts.rowid",
+        query,
+        limit,
+        "SELECT * FROM patients WHERE first_name LIKE ? OR last_name LIKE ? LIMIT ?",
+    )
+
+
+@cached("doctors", "departments")
+def search_doctors(query: str, limit: int = SEARCH_LIMIT) -> List[Doctor]:
+    """Doctors whose name or email contain every word of `query` as a prefix, best match first."""
+    return _search(
+        Doctor,
+        "doctors_fts",
+        "SELECT d.*, dep.name as department_name FROM doctors_fts JOIN doctors d ON d.id = doctors_fts.rowid "
+        "LEFT JOIN departments dep ON d.department_id = dep.id",
+        query,
+        limit,
+        "SELECT d.*, dep.name as department_name FROM doctors d LEFT JOIN departments dep ON d.department_id = dep.id "
+        "WHERE d.first_name LIKE ? OR d.last_name LIKE ? LIMIT ?",
+    )
+
+
+# Statistics
+#
+# Read the trigger-maintained stats_* tables, whose size depends on the
+# number of days, doctors and departments but not on appointment history.
+
+STATS_DAYS = 30
+
+
+def appointments_per_day(days: int = STATS_DAYS, end: Optional[str] = None):
+    """DataFrame of (day, status, appointments) for the `days` days ending at `end` (default today).
+
+    The window is resolved to dates before the cached lookup, so the cache
+    key changes at midnight rather than serving yesterday's window.
+    """
+    last = (_as_datetime(end) if end else datetime.now()).date()
+    first = last - timedelta(days=days - 1)
+    return _daily_counts(first.isoformat(), last.isoformat())
+
+
+@cached("appointments")
+def _daily_counts(first: str, last: str):
+    return fetch_frame(
+        "SELECT day, status, n AS appointments FROM stats_daily WHERE day BETWEEN ? AND ? AND n > 0",
+        (first, last),
+    )
+
+
+@cached("appointments", "departments")
+def appointments_by_department():
+    """DataFrame of (department, status, appointments) over all time."""
+    return fetch_frame(
+        "SELECT COALESCE(dep.name, '(none)') AS department, s.status, s.n AS appointments "
+        "FROM stats_by_department s LEFT JOIN departments dep ON dep.id = s.department_id WHERE s.n > 0"
+    )
+
+
+@cached("appointments", "doctors")
+def appointments_by_doctor(limit: int = 10):
+    """DataFrame of (doctor, status, appointments) for the `limit` busiest doctors."""
+    return fetch_frame(
+        "WITH top AS (SELECT doctor_id FROM stats_by_doctor WHERE doctor_id != 0 "
+        "GROUP BY doctor_id ORDER BY SUM(n) DESC LIMIT ?) "
+        "SELECT 'Dr. ' || d.first_name || ' ' || d.last_name AS doctor, s.status, s.n AS appointments "
+        "FROM top JOIN stats_by_doctor s ON s.doctor_id = top.doctor_id "
+        "JOIN doctors d ON d.id = top.doctor_id WHERE s.n > 0",
+        (limit,),
+    )
+
+
+@cached("appointments", "patients")
+def stats_totals() -> Dict[str, int]:
+    """Headline counts: patients, appointments, and appointments per status."""
+    with read_conn() as conn:
+        totals = {"patients": 0, "appointments": 0}
+        for name, n in conn.execute("SELECT name, n FROM stats_totals"):
+            totals[name] = n
+        for status, n in conn.execute("SELECT status, SUM(n) FROM stats_by_department GROUP BY status"):
+            totals[status or "(none)"] = n
+            totals["appointments"] += n
+        return totals
+
+
+# Scheduling
+
+class SchedulingConflict(ValueError):
+    """The requested interval overlaps an existing appointment."""
+
+    def __init__(self, message: str, appointment: Appointment):
+        super().__init__(message)
+        self.appointment = appointment
+
+
+def _as_datetime(value) -> datetime:
+    """Parse an ISO 8601 time (either separator, any precision, with or without an offset).
+
+    Stored times are naive local times to the second, so an offset is
+    converted to local time and fractions of a second are dropped.
+    """
+    value = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).strip())
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.replace(microsecond=0)
+
+
+def _iso(value: datetime) -> str:
+    return value.isoformat(timespec="seconds")
+
+
+def _interval(start_time, end_time) -> Tuple[datetime, datetime]:
+    """Parse and validate an appointment interval, defaulting the end time."""
+    start = _as_datetime(start_time)
+    end = _as_datetime(end_time) if end_time else start + timedelta(minutes=DEFAULT_DURATION_MIN)
+    if end <= start:
+        raise ValueError("end_time must be after start_time")
+    if end - start > timedelta(minutes=MAX_DURATION_MIN):
+        raise ValueError(f"appointments cannot be longer than {MAX_DURATION_MIN} minutes")
+    return start, end
+
+
+# Appointments overlapping [start, end) for one doctor or patient. The lower
+# bound on start_time (start - MAX_DURATION_MIN) turns this into a bounded
+# range scan on the (doctor_id|patient_id, start_time) index.
+_OVERLAP_SQL = """
+    SELECT id, patient_id, doctor_id, start_time,
+           COALESCE(end_time, strftime('%Y-%m-%dT%H:%M:%S', start_time, '+{default} minutes')) AS end_time
+    FROM appointments
+    WHERE {column} = ? AND start_time > ? AND start_time < ?
+      AND COALESCE(end_time, strftime('%Y-%m-%dT%H:%M:%S', start_time, '+{default} minutes')) > ?
+      AND COALESCE(status, 'scheduled') != 'cancelled'
+      AND id != ?
+    ORDER BY start_time
+"""
+
+
+def _busy(conn: sqlite3.Connection, column: str, owner_id: int, start: datetime, end: datetime, exclude_id: Optional[int] = None) -> List[Appointment]:
+    sql = _OVERLAP_SQL.format(column=column, default=DEFAULT_DURATION_MIN)
+    lower = start - timedelta(minutes=MAX_DURATION_MIN)
+    return _fetch_rows(conn, Appointment, sql, (owner_id, _iso(lower), _iso(end), _iso(start), exclude_id or -1))
+
+
+def find_conflict(
+    doctor_id: Optional[int],
+    patient_id: Optional[int],
+    start_time,
+    end_time=None,
+    exclude_id: Optional[int] = None,
+) -> Optional[Appointment]:
+    """Return an existing appointment overlapping the interval for this doctor or patient, if any."""
+    start, end = _interval(start_time, end_time)
+    with read_conn() as conn:
+        return _find_conflict(conn, doctor_id, patient_id, start, end, exclude_id)
+
+
+def _find_conflict(conn, doctor_id, patient_id, start, end, exclude_id=None) -> Optional[Appointment]:
+    for column, owner in (("doctor_id", doctor_id), ("patient_id", patient_id)):
+        if owner is not None:
+            rows = _busy(conn, column, owner, start, end, exclude_id)
+            if rows:
+                return rows[0]
+    return None
+
+
+def _check_available(conn, doctor_id, patient_id, start, end, exclude_id=None) -> None:
+    clash = _find_conflict(conn, doctor_id, patient_id, start, end, exclude_id)
+    if clash is not None:
+        who = "doctor" if doctor_id is not None and clash.doctor_id == doctor_id else "patient"
+        raise SchedulingConflict(
+            f"The {who} already has appointment {clash.id} from {clash.start_time} to {clash.end_time}",
+            clash,
+        )
+
+
+def _ceil_to_step(value: datetime, step: timedelta) -> datetime:
+    base = datetime.combine(value.date(), time())
+    steps = -(-(value - base) // step)
+    return base + steps * step
+
+
+def _doctor_free_slots(conn, doctor_id: int, patient_id: Optional[int], after: datetime, duration: timedelta, step: timedelta, horizon_days: int) -> Iterator[Tuple[datetime, datetime, int]]:
+    """Free working-hour slots for one doctor, earliest first, fetched a day at a time."""
+    for offset in range(horizon_days):
+        day = after.date() + timedelta(days=offset)
+        opens = datetime.combine(day, WORKDAY_START)
+        closes = datetime.combine(day, WORKDAY_END)
+        t = _ceil_to_step(max(opens, after), step)
+        busy = [(_as_datetime(r.start_time), _as_datetime(r.end_time)) for r in _busy(conn, "doctor_id", doctor_id, opens, closes)]
+        if patient_id is not None:
+            busy += [(_as_datetime(r.start_time), _as_datetime(r.end_time)) for r in _busy(conn, "patient_id", patient_id, opens, closes)]
+        while t + duration <= closes:
+            blocking = [e for s, e in busy if s < t + duration and e > t]
+            if blocking:
+                t = _ceil_to_step(max(blocking), step)
+                continue
+            yield t, t + duration, doctor_id
+            t += step
+
+
+def next_free_slots(
+    doctor_id: Optional[int] = None,
+    department_id: Optional[int] = None,
+    count: int = 5,
+    after: Optional[datetime] = None,
+    duration_min: int = DEFAULT_DURATION_MIN,
+    patient_id: Optional[int] = None,
+    horizon_days: int = 30,
+) -> List[Dict[str, Any]]:
+    """The next `count` free slots for a doctor, or across a department's doctors.
+
+    Slots fall within WORKDAY_START..WORKDAY_END on SLOT_STEP_MIN boundaries;
+    passing `patient_id` also avoids that patient's existing appointments.
+    """
+    after = _as_datetime(after) if after else datetime.now()
+    duration = timedelta(minutes=duration_min)
+    step = timedelta(minutes=SLOT_STEP_MIN)
+    with read_conn() as conn:
+        if doctor_id is not None:
+            doctor_ids = [doctor_id]
+        elif department_id is not None:
+            doctor_ids = [r[0] for r in conn.execute("SELECT id FROM doctors WHERE department_id = ?", (department_id,))]
+        else:
+            raise ValueError("doctor_id or department_id is required")
+        streams = [_doctor_free_slots(conn, d, patient_id, after, duration, step, horizon_days) for d in doctor_ids]
+        slots = list(itertools.islice(heapq.merge(*streams), count))
+    return [{"doctor_id": d, "start_time": _iso(s), "end_time": _iso(e)} for s, e, d in slots]
 
 
 # Appointments
 
+@queued
 def add_appointment(patient_id: int, doctor_id: Optional[int], department_id: Optional[int], start_time: str, end_time: Optional[str] = None, reason: Optional[str] = None) -> int:
-    conn = get_conn()
-    cur = conn.execute(
-        "INSERT INTO appointments (patient_id, doctor_id, department_id, start_time, end_time, reason) VALUES (?, ?, ?, ?, ?, ?)",
-        (patient_id, doctor_id, department_id, start_time, end_time, reason),
-    )
-    conn.commit()
-    aid = cur.lastrowid
-    conn.close()
-    return aid
-
-
-def list_appointments() -> List[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.execute(
-        """
-        SELECT a.*, p.first_name as patient_first, p.last_name as patient_last,
-               d.first_name as doctor_first, d.last_name as doctor_last, dep.name as department_name
-        FROM appointments a
-        JOIN patients p ON a.patient_id = p.id
-        LEFT JOIN doctors d ON a.doctor_id = d.id
-        LEFT JOIN departments dep ON a.department_id = dep.id
-        """
+    """Book an appointment; raises SchedulingConflict if the doctor or patient is busy.
+
+    A missing end_time defaults to DEFAULT_DURATION_MIN after the start.
+    """
+    start, end = _interval(start_time, end_time)
+    with transaction() as conn:
+        _check_available(conn, doctor_id, patient_id, start, end)
+        cur = conn.execute(
+            "INSERT INTO appointments (patient_id, doctor_id, department_id, start_time, end_time, reason) VALUES (?, ?, ?, ?, ?, ?)",
+            (patient_id, doctor_id, department_id, _iso(start), _iso(end), reason),
+        )
+        return cur.lastrowid
+
+
+APPOINTMENT_COLUMNS = ("patient_id", "doctor_id", "department_id", "start_time", "end_time", "status", "reason")
+
+
+def _validate_appointments(conn: sqlite3.Connection, chunk: List[Mapping[str, Any]]) -> Dict[int, str]:
+    """Reject rows that are invalid or would double-book a doctor or patient.
+
+    A row needs a valid interval and an existing patient_id, and unless it
+    is cancelled it must not overlap that doctor's or patient's other
+    appointments, stored or earlier in the chunk. Accepted rows are
+    replaced by copies with start_time and end_time in the stored
+    "YYYY-MM-DDTHH:MM:SS" form, whatever ISO format they came in.
+    """
+    problems = {}
+    wanted = set()
+    for pos, row in enumerate(chunk):
+        if not row.get("start_time"):
+            problems[pos] = "start_time is required"
+        else:
+            try:
+                start, end = _interval(row["start_time"], row.get("end_time") or None)
+            except ValueError as exc:
+                problems[pos] = str(exc)
+            else:
+                chunk[pos] = {**row, "start_time": _iso(start), "end_time": _iso(end) if row.get("end_time") else None}
+        try:
+            wanted.add(int(row.get("patient_id")))
+        except (TypeError, ValueError):
+            problems.setdefault(pos, "patient_id must be an integer")
+    found = set()
+    wanted = list(wanted)
+    # Stay under SQLite's bound-parameter limit.
+    for i in range(0, len(wanted), 900):
+        part = wanted[i:i + 900]
+        marks = ", ".join("?" for _ in part)
+        found.update(r[0] for r in conn.execute(f"SELECT id FROM patients WHERE id IN ({marks})", part))
+    for pos, row in enumerate(chunk):
+        if pos not in problems and int(row["patient_id"]) not in found:
+            problems[pos] = f"patient {row['patient_id']} does not exist"
+    # Same overlap rule as add_appointment: against stored rows (which
+    # include earlier chunks of this import) and within the chunk.
+    taken: Dict[Tuple[str, int], List[Tuple[datetime, datetime]]] = {}
+    for pos, row in enumerate(chunk):
+        if pos in problems or (row.get("status") or "scheduled") == "cancelled":
+            continue
+        start, end = _interval(row["start_time"], row.get("end_time"))
+        try:
+            doctor_id = int(row["doctor_id"]) if row.get("doctor_id") not in (None, "") else None
+        except (TypeError, ValueError):
+            problems[pos] = "doctor_id must be an integer"
+            continue
+        owners = ([("doctor", doctor_id)] if doctor_id is not None else []) + [("patient", int(row["patient_id"]))]
+        try:
+            _check_available(conn, doctor_id, int(row["patient_id"]), start, end)
+        except SchedulingConflict as exc:
+            problems[pos] = str(exc)
+            continue
+        clash = next((o for o in owners for s, e in taken.get(o, ()) if s < end and e > start), None)
+        if clash is not None:
+            problems[pos] = f"The {clash[0]} already has an overlapping appointment earlier in this import"
+            continue
+        for owner in owners:
+            taken.setdefault(owner, []).append((start, end))
+    return problems
+
+
+@queued(batch=False)
+def add_appointments_bulk(rows: Iterable[Mapping[str, Any]], chunk_size: int = BULK_CHUNK_SIZE, start_index: int = 0) -> BulkResult:
+    """Insert many appointments (mappings keyed by APPOINTMENT_COLUMNS) in one transaction."""
+    return _insert_bulk(
+        "INSERT INTO appointments (patient_id, doctor_id, department_id, start_time, end_time, status, reason) "
+        "VALUES (?, ?, ?, ?, ?, COALESCE(?, 'scheduled'), ?)",
+        APPOINTMENT_COLUMNS, rows, chunk_size, _validate_appointments, start_index,
     )
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
-    return rows
 
 
-def get_appointment(appointment_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.execute("SELECT * FROM appointments WHERE id = ?", (appointment_id,))
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+# The appointment SELECTs below read from "{appointments}", filled in by
+# _appointment_selects with the hot table and, for history, the archive.
+# CROSS JOIN keeps the appointments table as the outer loop: ANALYZE can
+# see an empty archive, and the planner would then scan patients and sort.
+_APPOINTMENT_SELECT = """
+    SELECT a.*, p.first_name as patient_first, p.last_name as patient_last,
+           d.first_name as doctor_first, d.last_name as doctor_last, dep.name as department_name
+    FROM {appointments} a
+    CROSS JOIN patients p ON a.patient_id = p.id
+    LEFT JOIN doctors d ON a.doctor_id = d.id
+    LEFT JOIN departments dep ON a.department_id = dep.id
+"""
+APPOINTMENT_SELECT = _APPOINTMENT_SELECT.format(appointments="appointments")
+
+# Display-ready appointment columns, with the names joined in SQL so no
+# per-row Python formatting is needed.
+_APPOINTMENT_FRAME_SELECT = """
+    SELECT a.id AS id,
+           p.first_name || ' ' || p.last_name AS patient,
+           CASE WHEN d.id IS NULL THEN '(none)' ELSE 'Dr. ' || d.first_name || ' ' || d.last_name END AS doctor,
+           COALESCE(dep.name, '(none)') AS department,
+           a.start_time, a.status, COALESCE(a.reason, '') AS reason
+    FROM {appointments} a
+    CROSS JOIN patients p ON a.patient_id = p.id
+    LEFT JOIN doctors d ON a.doctor_id = d.id
+    LEFT JOIN departments dep ON a.department_id = dep.id
+"""
+APPOINTMENT_FRAME_SELECT = _APPOINTMENT_FRAME_SELECT.format(appointments="appointments")
+
+
+def _appointment_selects(template: str, include_history: bool) -> List[str]:
+    tables = ("appointments", "archive.appointments") if include_history else ("appointments",)
+    return [template.format(appointments=t) for t in tables]
+
+
+@cached("appointments", "patients", "doctors", "departments")
+def list_appointments(include_history: bool = False) -> List[Appointment]:
+    """Every current appointment; `include_history` adds the archived ones."""
+    with read_conn() as conn:
+        return _fetch_rows(conn, Appointment, " UNION ALL ".join(_appointment_selects(_APPOINTMENT_SELECT, include_history)))
+
+
+def _appointment_filters(
+    patient_id: Optional[int],
+    doctor_id: Optional[int],
+    department_id: Optional[int],
+    status: Optional[str],
+) -> Tuple[List[str], List[Any]]:
+    where, params = [], []
+    for column, value in (
+        ("a.patient_id", patient_id),
+        ("a.doctor_id", doctor_id),
+        ("a.department_id", department_id),
+        ("a.status", status),
+    ):
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+    return where, params
+
 
+@cached("appointments", "patients", "doctors", "departments")
+def list_appointments_page(
+    limit: int = PAGE_SIZE,
+    after: Optional[Cursor] = None,
+    patient_id: Optional[int] = None,
+    doctor_id: Optional[int] = None,
+    department_id: Optional[int] = None,
+    status: Optional[str] = None,
+    descending: bool = True,
+    include_history: bool = False,
+) -> Page:
+    """Appointments keyset-paginated on (start_time, id), latest first by default.
 
+    Only the hot table is read unless `include_history` is set.
+    """
+    where, params = _appointment_filters(patient_id, doctor_id, department_id, status)
+    select = _appointment_selects(_APPOINTMENT_SELECT, include_history)
+    with read_conn() as conn:
+        return _keyset_page(conn, Appointment, select, ("a.start_time", "a.id"), where, params, after, limit, descending)
+
+
+@cached("appointments", "patients", "doctors", "departments")
+def appointments_frame(
+    limit: Optional[int] = PAGE_SIZE,
+    after: Optional[Cursor] = None,
+    patient_id: Optional[int] = None,
+    doctor_id: Optional[int] = None,
+    department_id: Optional[int] = None,
+    status: Optional[str] = None,
+    descending: bool = True,
+    include_history: bool = False,
+):
+    """DataFrame of display columns (patient, doctor, department, ...) with keyset paging."""
+    where, params = _appointment_filters(patient_id, doctor_id, department_id, status)
+    select = _appointment_selects(_APPOINTMENT_FRAME_SELECT, include_history)
+    with read_conn() as conn:
+        return _keyset_frame(conn, select, ("a.start_time", "a.id"), where, params, after, limit, descending)
+
+
+@cached("appointments", "patients", "doctors", "departments")
+def appointments_between(
+    start,
+    end,
+    doctor_id: Optional[int] = None,
+    department_id: Optional[int] = None,
+    patient_id: Optional[int] = None,
+    status: Optional[str] = None,
+    include_history: bool = False,
+) -> List[Appointment]:
+    """Appointments overlapping [start, end), earliest first, optionally for one doctor, department or patient.
+
+    Like the conflict check, the start_time lower bound is pulled back by
+    MAX_DURATION_MIN so the query stays a bounded range scan on the
+    (owner, start_time) index while still catching appointments that
+    began before the window.
+    """
+    lo, hi = _as_datetime(start), _as_datetime(end)
+    where, params = _appointment_filters(patient_id, doctor_id, department_id, status)
+    where += [
+        "a.start_time > ?",
+        "a.start_time < ?",
+        f"COALESCE(a.end_time, strftime('%Y-%m-%dT%H:%M:%S', a.start_time, '+{DEFAULT_DURATION_MIN} minutes')) > ?",
+    ]
+    params += [_iso(lo - timedelta(minutes=MAX_DURATION_MIN)), _iso(hi), _iso(lo)]
+    select = _appointment_selects(_APPOINTMENT_SELECT, include_history)
+    sql, params = _keyset_sql(select, ("a.start_time", "a.id"), where, params, None, None, descending=False)
+    with read_conn() as conn:
+        return _fetch_rows(conn, Appointment, sql, params)
+
+
+def get_appointment(appointment_id: int, include_history: bool = False) -> Optional[Appointment]:
+    with read_conn() as conn:
+        row = _fetch_row(conn, Appointment, "SELECT * FROM appointments WHERE id = ?", (appointment_id,))
+        if row is None and include_history:
+            row = _fetch_row(conn, Appointment, "SELECT * FROM archive.appointments WHERE id = ?", (appointment_id,))
+    return row
+
+
+@queued
 def update_appointment(appointment_id: int, patient_id: int, doctor_id: Optional[int], department_id: Optional[int], start_time: str, end_time: Optional[str], status: Optional[str], reason: Optional[str]) -> None:
-    conn = get_conn()
-    conn.execute(
-        """
-        UPDATE appointments SET patient_id = ?, doctor_id = ?, department_id = ?, start_time = ?, end_time = ?, status = ?, reason = ? WHERE id = ?
-        """,
-        (patient_id, doctor_id, department_id, start_time, end_time, status, reason, appointment_id),
-    )
-    conn.commit()
-    conn.close()
+    """Update an appointment; raises SchedulingConflict unless it is being cancelled."""
+    start, end = _interval(start_time, end_time)
+    with transaction() as conn:
+        if status != "cancelled":
+            _check_available(conn, doctor_id, patient_id, start, end, exclude_id=appointment_id)
+        conn.execute(
+            """
+            UPDATE appointments SET patient_id = ?, doctor_id = ?, department_id = ?, start_time = ?, end_time = ?, status = ?, reason = ? WHERE id = ?
+            """,
+            (patient_id, doctor_id, department_id, _iso(start), _iso(end), status, reason, appointment_id),
+        )
 
 
+@queued
 def delete_appointment(appointment_id: int) -> None:
-    conn = get_conn()
-    conn.execute("DELETE FROM appointments WHERE id = ?", (appointment_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("DELETE FROM appointments WHERE id = ?", (appointment_id,))
+
+
+# Archive
+#
+# Appointments that started more than ARCHIVE_AFTER_DAYS ago live in the
+# attached archive database, so the hot table, its indexes and the stats
+# tables grow with current work rather than with history. Readers take
+# include_history=True to union the archive back in.
+
+def archive_appointments(
+    older_than_days: int = ARCHIVE_AFTER_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    now: Optional[datetime] = None,
+) -> int:
+    """Move appointments that started before the horizon to the archive; returns the number moved.
+
+    Each batch is a separate job on the write queue, so writes submitted
+    meanwhile run between batches instead of waiting for the whole run.
+    """
+    cutoff = _iso((now or datetime.now()) - timedelta(days=older_than_days))
+    moved = 0
+    while True:
+        count = _archive_batch(cutoff, batch_size)
+        if not count:
+            return moved
+        moved += count
+
+
+@queued(batch=False)
+def _archive_batch(cutoff: str, batch_size: int) -> int:
+    """Move up to `batch_size` appointments starting before `cutoff`; returns the number moved.
+
+    The batch is copied and committed before it is deleted from the hot
+    table. A transaction spanning two WAL files is not atomic across them,
+    and this order can only leave a row in both (the next run finishes
+    moving it), never in neither.
+    """
+    with get_conn() as conn:
+        ids = [r[0] for r in conn.execute(
+            "SELECT id FROM appointments WHERE start_time < ? ORDER BY start_time LIMIT ?", (cutoff, batch_size)
+        )]
+        if not ids:
+            return 0
+        batch = json.dumps(ids)
+        with transaction():
+            conn.execute(
+                "INSERT OR REPLACE INTO archive.appointments SELECT * FROM appointments WHERE id IN (SELECT value FROM json_each(?))",
+                (batch,),
+            )
+        with transaction():
+            conn.execute("DELETE FROM appointments WHERE id IN (SELECT value FROM json_each(?))", (batch,))
+        return len(ids)
+
+
+def archive_stats() -> Dict[str, Any]:
+    """Size and start_time range of the archive, and the oldest hot appointment."""
+    with read_conn() as conn:
+        archived, oldest, newest = conn.execute(
+            "SELECT COUNT(*), MIN(start_time), MAX(start_time) FROM archive.appointments"
+        ).fetchone()
+        oldest_hot = conn.execute("SELECT MIN(start_time) FROM appointments").fetchone()[0]
+    return {
+        "path": archive_path(),
+        "archived": archived,
+        "oldest_archived": oldest,
+        "newest_archived": newest,
+        "oldest_hot": oldest_hot,
+    }
+
+
+# Exports
+
+EXPORTS = {
+    "patients": "SELECT * FROM patients ORDER BY id",
+    "doctors": "SELECT * FROM doctors ORDER BY id",
+    "departments": "SELECT * FROM departments ORDER BY id",
+    "appointments": "SELECT * FROM appointments ORDER BY id",
+    "appointments_view": APPOINTMENT_FRAME_SELECT + " ORDER BY a.id",
+}
+
+
+def export_columns(name: str) -> List[Tuple[str, str]]:
+    """(column, declared type) pairs of export `name`.
+
+    The type is the one declared on the underlying table column, or ""
+    for a computed column. Read through a temporary view, which is the
+    only place SQLite reports declared types for a SELECT.
+    """
+    with get_conn() as conn:
+        conn.execute(f"CREATE TEMP VIEW export_columns_{name} AS {EXPORTS[name]}")
+        try:
+            return [(r[1], r[2]) for r in conn.execute(f"PRAGMA temp.table_info(export_columns_{name})")]
+        finally:
+            conn.execute(f"DROP VIEW temp.export_columns_{name}")
+
+
+def iter_export(name: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[Tuple[List[str], List[tuple]]]:
+    """Yield (column names, row tuples) chunks of an export via fetchmany.
+
+    Uses its own connection rather than the pool: the cursor stays open for
+    as long as the caller keeps consuming, and WAL gives it a consistent
+    snapshot for the whole export.
+    """
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        cur.row_factory = None
+        cur.execute(EXPORTS[name])
+        columns = [c[0] for c in cur.description]
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield columns, rows
+    finally:
+        conn.close()
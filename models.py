@@ -0,0 +1,115 @@
+"""Typed row classes for the tables db.py reads.
+
+Rows are slotted dataclasses built straight from the cursor's tuples by a
+per-query row_factory, instead of a sqlite3.Row that is then copied into
+a dict. A slotted instance has no per-row __dict__ or key table, so it is
+smaller than the dict it replaces and cheaper to build. Instances are
+frozen, since the read cache and the per-render memo share them between
+callers.
+
+Row keeps the dict-style reads (row["id"], row.get("email"), dict(row))
+that older call sites use; new code should prefer attribute access.
+"""
+import functools
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, Type
+
+
+class Row:
+    """Read-only mapping access over a model's fields."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.__slots__
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def keys(self) -> Tuple[str, ...]:
+        return self.__slots__
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+@dataclass(slots=True, frozen=True)
+class Patient(Row):
+    id: int
+    first_name: str
+    last_name: str
+    dob: Optional[str]
+    gender: Optional[str]
+    phone: Optional[str]
+    email: Optional[str]
+    created_at: Optional[str]
+
+
+@dataclass(slots=True, frozen=True)
+class Department(Row):
+    id: int
+    name: str
+    created_at: Optional[str]
+
+
+@dataclass(slots=True, frozen=True)
+class Doctor(Row):
+    id: int
+    first_name: str
+    last_name: str
+    department_id: Optional[int]
+    email: Optional[str]
+    created_at: Optional[str]
+    # Joined from departments by list_doctors and search_doctors.
+    department_name: Optional[str] = None
+
+
+@dataclass(slots=True, frozen=True)
+class Appointment(Row):
+    id: int
+    patient_id: int
+    doctor_id: Optional[int]
+    department_id: Optional[int]
+    start_time: str
+    end_time: Optional[str]
+    status: Optional[str]
+    reason: Optional[str]
+    created_at: Optional[str]
+    # Joined names, filled in by queries built on db.APPOINTMENT_SELECT.
+    patient_first: Optional[str] = None
+    patient_last: Optional[str] = None
+    doctor_first: Optional[str] = None
+    doctor_last: Optional[str] = None
+    department_name: Optional[str] = None
+
+
+RowFactory = Callable[[Any, tuple], Row]
+
+
+def row_factory(model: Type[Row], description: Sequence[tuple]) -> RowFactory:
+    """A cursor row_factory building `model` instances for a query's columns.
+
+    When the columns are exactly the model's fields, in order, each row is
+    passed straight to the constructor. Otherwise they are matched by name
+    and fields the query does not select are None. A column the model has
+    no field for is an error, so models must follow schema changes.
+    """
+    return _factory(model, tuple(d[0] for d in description))
+
+
+@functools.lru_cache(maxsize=256)
+def _factory(model: Type[Row], names: Tuple[str, ...]) -> RowFactory:
+    fields = model.__slots__
+    if names == fields:
+        return lambda cursor, row: model(*row)
+    unknown = [n for n in names if n not in fields]
+    if unknown:
+        raise TypeError(f"{model.__name__} has no field for column(s): {', '.join(unknown)}")
+    index = {name: i for i, name in enumerate(names)}
+    positions = [index.get(f) for f in fields]
+    return lambda cursor, row: model(*[None if i is None else row[i] for i in positions])
@@ -0,0 +1,263 @@
+"""In-process profiler for db.py statements, db functions and app reruns.
+
+Every statement run through a db.CountingCursor (execute plus the
+fetches that read its rows), every call into a function wrapped by
+instrument(), and every rerun reported with end_run() becomes a Record
+in a ring buffer of the last RING_SIZE entries. Records slower than
+SLOW_QUERY_MS are also appended to LOG_PATH when it is set: JSON lines
+for a *.jsonl path, otherwise a slow_queries table in that SQLite file.
+
+Only the shape of query parameters (count and types) is recorded, never
+their values, so patient data does not end up in the buffer or the log.
+
+The settings are process-wide and come from the environment at import
+(HOSPITAL_PROFILE, HOSPITAL_PROFILE_SLOW_MS, HOSPITAL_PROFILE_LOG), so no
+single session can change them for everyone else.
+"""
+import functools
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from time import perf_counter
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+ENABLED = os.environ.get("HOSPITAL_PROFILE", "1") not in ("", "0")
+RING_SIZE = 5000
+SLOW_QUERY_MS = float(os.environ.get("HOSPITAL_PROFILE_SLOW_MS", "100"))
+# Slow-record log: None disables it, "*.jsonl" writes JSON lines, anything
+# else is treated as a separate SQLite file (not the application database).
+LOG_PATH: Optional[str] = os.environ.get("HOSPITAL_PROFILE_LOG") or None
+
+FIELDS = ("ts", "kind", "function", "sql", "params", "rows", "queries", "ms")
+
+
+class Record:
+    """One timed statement ("query"), db function call ("call") or app rerun ("rerun")."""
+
+    __slots__ = FIELDS + ("done",)
+
+    def __init__(self, kind: str, function: str, sql: str = "", params: str = ""):
+        self.ts = time.time()
+        self.kind = kind
+        self.function = function
+        self.sql = sql
+        self.params = params
+        self.rows = 0
+        self.queries = 0
+        self.ms = 0.0
+        self.done = False
+
+    @property
+    def slow(self) -> bool:
+        return self.ms >= SLOW_QUERY_MS
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {f: getattr(self, f) for f in FIELDS}
+
+
+_ring: Deque[Record] = deque(maxlen=RING_SIZE)
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+def _stack() -> List[Record]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _run() -> Dict[str, float]:
+    run = getattr(_local, "run", None)
+    if run is None:
+        run = _local.run = {"queries": 0, "query_ms": 0.0, "rows": 0, "calls": 0, "slow": 0}
+    return run
+
+
+def param_shape(parameters: Any, many: bool = False) -> str:
+    """Describe bound parameters without their values, e.g. "3: int, str, None"."""
+    if many:
+        try:
+            count = len(parameters)
+        except TypeError:
+            return "many"
+        return f"{count} rows"
+    if not parameters:
+        return ""
+    values = parameters.values() if isinstance(parameters, dict) else parameters
+    types = ", ".join("None" if v is None else type(v).__name__ for v in values)
+    return f"{len(parameters)}: {types}"
+
+
+def start_query(sql: str, parameters: Any = (), many: bool = False) -> Optional[Record]:
+    """Open a record for a statement about to run, or None when profiling is off."""
+    if not ENABLED:
+        return None
+    stack = _stack()
+    rec = Record("query", stack[-1].function if stack else "", " ".join(sql.split()), param_shape(parameters, many))
+    rec.queries = 1
+    return rec
+
+
+def add(rec: Record, seconds: float, rows: int = 0) -> None:
+    """Charge time and rows (from execute or a later fetch) to an open record."""
+    rec.ms += seconds * 1000
+    rec.rows += rows
+
+
+def finish(rec: Optional[Record]) -> None:
+    """Close a record: buffer it, add it to the run totals and log it if slow."""
+    if rec is None or rec.done:
+        return
+    rec.done = True
+    _ring.append(rec)
+    if rec.kind == "query":
+        run = _run()
+        run["queries"] += 1
+        run["query_ms"] += rec.ms
+        run["rows"] += rec.rows
+        stack = _stack()
+        if stack:
+            stack[-1].queries += 1
+            stack[-1].rows += rec.rows
+    elif rec.kind == "call":
+        _run()["calls"] += 1
+    if rec.slow and rec.kind != "rerun":
+        _run()["slow"] += 1
+        _log(rec)
+
+
+def _log(rec: Record) -> None:
+    path = LOG_PATH
+    if not path:
+        return
+    with _log_lock:
+        if path.endswith(".jsonl"):
+            with open(path, "a") as f:
+                f.write(json.dumps(rec.as_dict()) + "\n")
+            return
+        # Plain sqlite3 rather than db.connect(): the log must not be
+        # profiled itself or take a connection from the application pool.
+        conn = sqlite3.connect(path)
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS slow_queries (ts REAL, kind TEXT, function TEXT, "
+                    "sql TEXT, params TEXT, rows INTEGER, queries INTEGER, ms REAL)"
+                )
+                conn.execute(f"INSERT INTO slow_queries ({', '.join(FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             tuple(getattr(rec, f) for f in FIELDS))
+        finally:
+            conn.close()
+
+
+def _traced(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return fn(*args, **kwargs)
+        rec = Record("call", fn.__name__)
+        stack = _stack()
+        stack.append(rec)
+        t0 = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            rec.ms = (perf_counter() - t0) * 1000
+            stack.pop()
+            if stack:
+                stack[-1].queries += rec.queries
+                stack[-1].rows += rec.rows
+            finish(rec)
+
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+def instrument(module, exclude: Iterable[str] = ()) -> None:
+    """Record every call to the public functions defined in `module`.
+
+    Functions are replaced in the module namespace, so calls between them
+    are traced too and statements are attributed to the innermost call.
+    Context managers and generators are skipped (their body runs after
+    the call returns), as is anything named in `exclude`. Safe to call
+    again, e.g. on every Streamlit rerun.
+    """
+    exclude = set(exclude)
+    for name, fn in list(vars(module).items()):
+        if name.startswith("_") or name in exclude:
+            continue
+        if not inspect.isfunction(fn) or fn.__module__ != module.__name__:
+            continue
+        if getattr(fn, "__profiled__", False):
+            continue
+        if inspect.isgeneratorfunction(getattr(fn, "__wrapped__", fn)):
+            continue
+        setattr(module, name, _traced(fn))
+
+
+def reset_run() -> None:
+    """Start per-rerun totals for the current thread."""
+    _local.run = None
+    _local.started = perf_counter()
+
+
+def run_totals() -> Dict[str, float]:
+    """Statements, statement time, rows, db calls and slow records since reset_run()."""
+    return dict(_run())
+
+
+def end_run(label: str) -> Record:
+    """Record the wall time since reset_run() as a "rerun" entry named `label`."""
+    rec = Record("rerun", label)
+    rec.ms = (perf_counter() - getattr(_local, "started", perf_counter())) * 1000
+    run = _run()
+    rec.queries, rec.rows = run["queries"], run["rows"]
+    if ENABLED:
+        finish(rec)
+    return rec
+
+
+def records(kind: Optional[str] = None) -> List[Record]:
+    """Buffered records, oldest first."""
+    return [r for r in list(_ring) if kind is None or r.kind == kind]
+
+
+def clear() -> None:
+    """Empty the ring buffer, resizing it to the current RING_SIZE."""
+    global _ring
+    _ring = deque(maxlen=RING_SIZE)
+
+
+def percentile(samples: Iterable[float], pct: float) -> float:
+    ordered = sorted(samples)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def summary(kind: str = "query") -> List[Dict[str, Any]]:
+    """Aggregate buffered records of `kind` by statement (or function name), by total time."""
+    groups: Dict[tuple, List[Record]] = {}
+    for rec in records(kind):
+        key = (rec.function, rec.sql) if kind == "query" else (rec.function, "")
+        groups.setdefault(key, []).append(rec)
+    rows = []
+    for (function, sql), recs in groups.items():
+        ms = [r.ms for r in recs]
+        rows.append({
+            "function": function,
+            "sql": sql,
+            "count": len(recs),
+            "total_ms": sum(ms),
+            "p50_ms": percentile(ms, 50),
+            "p95_ms": percentile(ms, 95),
+            "max_ms": max(ms),
+            "rows": sum(r.rows for r in recs),
+            "queries": sum(r.queries for r in recs),
+        })
+    rows.sort(key=lambda r: r["total_ms"], reverse=True)
+    return rows
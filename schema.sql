@@ -44,3 +44,166 @@ CREATE TABLE IF NOT EXISTS appointments (
   FOREIGN KEY(department_id) REFERENCES departments(id)
 );
 
+-- Indexes for the hot read paths in db.py. Keyset pagination orders by
+-- (created_at, id) / (start_time, id); the rowid is implicitly the last
+-- column of every index, so single-column indexes cover both.
+CREATE INDEX IF NOT EXISTS idx_patients_created_at ON patients(created_at);
+CREATE INDEX IF NOT EXISTS idx_doctors_last_name ON doctors(last_name);
+CREATE INDEX IF NOT EXISTS idx_doctors_department ON doctors(department_id);
+CREATE INDEX IF NOT EXISTS idx_appointments_start ON appointments(start_time);
+CREATE INDEX IF NOT EXISTS idx_appointments_patient ON appointments(patient_id, start_time);
+CREATE INDEX IF NOT EXISTS idx_appointments_doctor ON appointments(doctor_id, start_time);
+CREATE INDEX IF NOT EXISTS idx_appointments_department ON appointments(department_id, start_time);
+CREATE INDEX IF NOT EXISTS idx_appointments_status ON appointments(status, start_time);
+
+-- Change counters for cache invalidation. Triggers bump a table's version
+-- on every write, whichever process or connection makes it, so cached
+-- reads in db.py can check freshness with one small query.
+CREATE TABLE IF NOT EXISTS table_versions (
+  name TEXT PRIMARY KEY,
+  version INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO table_versions (name) VALUES ('patients'), ('departments'), ('doctors'), ('appointments');
+CREATE TRIGGER IF NOT EXISTS patients_version_insert AFTER INSERT ON patients
+BEGIN UPDATE table_versions SET version = version + 1 WHERE name = 'patients'; END;
+CREATE TRIGGER IF NOT EXISTS patients_version_update AFTER UPDATE ON patients
+BEGIN UPDATE table_versions SET version = version + 1 WHERE name = 'patients'; END;
+CREATE TRIGGER IF NOT EXISTS patients_version_delete AFTER DELETE ON patients
+BEGIN UPDATE table_versions SET version = version + 1 WHERE name = 'patients'; END;
+CREATE TRIGGER IF NOT EXISTS departments_version_insert AFTER INSERT ON departments
+BEGIN UPDATE table_versions SET version = version + 1 WHERE name = 'departments'; END;
+CREATE TRIGGER IF NOT EXISTS departments_version_update AFTER UPDATE ON departments
+BEGIN UPDATE table_versions SET version = version + 1 WHERE name = 'departments'; END;
+CREATE TRIGGER IF NOT EXISTS departments_version_delete AFTER DELETE ON departments
+BEGIN UPDATE table_versions SET version = version + 1 WHERE name = 'departments'; END;
+CREATE TRIGGER IF NOT EXISTS doctors_version_insert AFTER INSERT ON doctors
+BEGIN UPDATE table_versions SET version = version + 1 WHERE name = 'doctors'; END;
+CREATE TRIGGER IF NOT EXISTS doctors_version_update AFTER UPDATE ON doctors
+BEGIN UPDATE table_versions SET version = version + 1 WHERE name = 'doctors'; END;
+CREATE TRIGGER IF NOT EXISTS doctors_version_delete AFTER DELETE ON doctors
+BEGIN UPDATE table_versions SET version = version + 1 WHERE name = 'doctors'; END;
+CREATE TRIGGER IF NOT EXISTS appointments_version_insert AFTER INSERT ON appointments
+BEGIN UPDATE table_versions SET version = version + 1 WHERE name = 'appointments'; END;
+CREATE TRIGGER IF NOT EXISTS appointments_version_update AFTER UPDATE ON appointments
+BEGIN UPDATE table_versions SET version = version + 1 WHERE name = 'appointments'; END;
+CREATE TRIGGER IF NOT EXISTS appointments_version_delete AFTER DELETE ON appointments
+BEGIN UPDATE table_versions SET version = version + 1 WHERE name = 'appointments'; END;
+
+-- Full-text search over patients and doctors. The FTS tables are
+-- contentless (only rowids come back; results are joined to the base
+-- table) so the phone column can also index a digits-only form of the
+-- number. Triggers keep them in sync; db.rebuild_search_index() repopulates
+-- them after bulk loads that bypass triggers.
+CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(name, email, phone, content='', prefix='2 3');
+CREATE VIRTUAL TABLE IF NOT EXISTS doctors_fts USING fts5(name, email, content='', prefix='2 3');
+-- Rank by BM25 with name matches weighted highest; ORDER BY rank then
+-- lets FTS5 sort internally instead of a temp b-tree.
+INSERT INTO patients_fts (patients_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 1.0)');
+INSERT INTO doctors_fts (doctors_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0)');
+
+-- Backfills only run against empty tables. The guard is the outer side of
+-- a CROSS JOIN so the base table is not even scanned when it is false.
+INSERT INTO patients_fts (rowid, name, email, phone)
+  SELECT p.id, p.first_name || ' ' || p.last_name, p.email, COALESCE(p.phone, '') || ' ' || replace(replace(replace(replace(replace(replace(COALESCE(p.phone, ''), '(', ''), ')', ''), '-', ''), ' ', ''), '.', ''), '+', '')
+  FROM (SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM patients_fts)) CROSS JOIN patients p;
+INSERT INTO doctors_fts (rowid, name, email)
+  SELECT d.id, d.first_name || ' ' || d.last_name, d.email
+  FROM (SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM doctors_fts)) CROSS JOIN doctors d;
+
+CREATE TRIGGER IF NOT EXISTS patients_fts_insert AFTER INSERT ON patients BEGIN
+  INSERT INTO patients_fts (rowid, name, email, phone) VALUES (new.id, new.first_name || ' ' || new.last_name, new.email, COALESCE(new.phone, '') || ' ' || replace(replace(replace(replace(replace(replace(COALESCE(new.phone, ''), '(', ''), ')', ''), '-', ''), ' ', ''), '.', ''), '+', ''));
+END;
+CREATE TRIGGER IF NOT EXISTS patients_fts_update AFTER UPDATE ON patients BEGIN
+  INSERT INTO patients_fts (patients_fts, rowid, name, email, phone) VALUES ('delete', old.id, old.first_name || ' ' || old.last_name, old.email, COALESCE(old.phone, '') || ' ' || replace(replace(replace(replace(replace(replace(COALESCE(old.phone, ''), '(', ''), ')', ''), '-', ''), ' ', ''), '.', ''), '+', ''));
+  INSERT INTO patients_fts (rowid, name, email, phone) VALUES (new.id, new.first_name || ' ' || new.last_name, new.email, COALESCE(new.phone, '') || ' ' || replace(replace(replace(replace(replace(replace(COALESCE(new.phone, ''), '(', ''), ')', ''), '-', ''), ' ', ''), '.', ''), '+', ''));
+END;
+CREATE TRIGGER IF NOT EXISTS patients_fts_delete AFTER DELETE ON patients BEGIN
+  INSERT INTO patients_fts (patients_fts, rowid, name, email, phone) VALUES ('delete', old.id, old.first_name || ' ' || old.last_name, old.email, COALESCE(old.phone, '') || ' ' || replace(replace(replace(replace(replace(replace(COALESCE(old.phone, ''), '(', ''), ')', ''), '-', ''), ' ', ''), '.', ''), '+', ''));
+END;
+CREATE TRIGGER IF NOT EXISTS doctors_fts_insert AFTER INSERT ON doctors BEGIN
+  INSERT INTO doctors_fts (rowid, name, email) VALUES (new.id, new.first_name || ' ' || new.last_name, new.email);
+END;
+CREATE TRIGGER IF NOT EXISTS doctors_fts_update AFTER UPDATE ON doctors BEGIN
+  INSERT INTO doctors_fts (doctors_fts, rowid, name, email) VALUES ('delete', old.id, old.first_name || ' ' || old.last_name, old.email);
+  INSERT INTO doctors_fts (rowid, name, email) VALUES (new.id, new.first_name || ' ' || new.last_name, new.email);
+END;
+CREATE TRIGGER IF NOT EXISTS doctors_fts_delete AFTER DELETE ON doctors BEGIN
+  INSERT INTO doctors_fts (doctors_fts, rowid, name, email) VALUES ('delete', old.id, old.first_name || ' ' || old.last_name, old.email);
+END;
+
+-- Dashboard aggregates. Triggers apply each appointment/patient write as a
+-- +1/-1 delta, so the Home page reads a few small rows instead of scanning
+-- appointments. A missing department or doctor is stored as 0 and a
+-- missing status as ''; counts that fall to zero stay as zero rows.
+-- db.rebuild_stats() recomputes them from scratch.
+CREATE TABLE IF NOT EXISTS stats_daily (
+  day TEXT NOT NULL,
+  status TEXT NOT NULL,
+  n INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, status)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stats_by_department (
+  department_id INTEGER NOT NULL,
+  status TEXT NOT NULL,
+  n INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (department_id, status)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stats_by_doctor (
+  doctor_id INTEGER NOT NULL,
+  status TEXT NOT NULL,
+  n INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (doctor_id, status)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stats_totals (
+  name TEXT PRIMARY KEY,
+  n INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT INTO stats_daily (day, status, n)
+  SELECT substr(start_time, 1, 10), COALESCE(status, ''), COUNT(*)
+  FROM (SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM stats_daily)) CROSS JOIN appointments GROUP BY 1, 2;
+INSERT INTO stats_by_department (department_id, status, n)
+  SELECT COALESCE(department_id, 0), COALESCE(status, ''), COUNT(*)
+  FROM (SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM stats_by_department)) CROSS JOIN appointments GROUP BY 1, 2;
+INSERT INTO stats_by_doctor (doctor_id, status, n)
+  SELECT COALESCE(doctor_id, 0), COALESCE(status, ''), COUNT(*)
+  FROM (SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM stats_by_doctor)) CROSS JOIN appointments GROUP BY 1, 2;
+INSERT OR IGNORE INTO stats_totals (name, n) SELECT 'patients', COUNT(*)
+  FROM (SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM stats_totals WHERE name = 'patients')) CROSS JOIN patients;
+
+CREATE TRIGGER IF NOT EXISTS appointments_stats_insert AFTER INSERT ON appointments BEGIN
+  INSERT INTO stats_daily (day, status, n) VALUES (substr(new.start_time, 1, 10), COALESCE(new.status, ''), 1)
+    ON CONFLICT (day, status) DO UPDATE SET n = n + excluded.n;
+  INSERT INTO stats_by_department (department_id, status, n) VALUES (COALESCE(new.department_id, 0), COALESCE(new.status, ''), 1)
+    ON CONFLICT (department_id, status) DO UPDATE SET n = n + excluded.n;
+  INSERT INTO stats_by_doctor (doctor_id, status, n) VALUES (COALESCE(new.doctor_id, 0), COALESCE(new.status, ''), 1)
+    ON CONFLICT (doctor_id, status) DO UPDATE SET n = n + excluded.n;
+END;
+CREATE TRIGGER IF NOT EXISTS appointments_stats_update AFTER UPDATE OF start_time, status, department_id, doctor_id ON appointments BEGIN
+  INSERT INTO stats_daily (day, status, n) VALUES (substr(old.start_time, 1, 10), COALESCE(old.status, ''), -1)
+    ON CONFLICT (day, status) DO UPDATE SET n = n + excluded.n;
+  INSERT INTO stats_by_department (department_id, status, n) VALUES (COALESCE(old.department_id, 0), COALESCE(old.status, ''), -1)
+    ON CONFLICT (department_id, status) DO UPDATE SET n = n + excluded.n;
+  INSERT INTO stats_by_doctor (doctor_id, status, n) VALUES (COALESCE(old.doctor_id, 0), COALESCE(old.status, ''), -1)
+    ON CONFLICT (doctor_id, status) DO UPDATE SET n = n + excluded.n;
+  INSERT INTO stats_daily (day, status, n) VALUES (substr(new.start_time, 1, 10), COALESCE(new.status, ''), 1)
+    ON CONFLICT (day, status) DO UPDATE SET n = n + excluded.n;
+  INSERT INTO stats_by_department (department_id, status, n) VALUES (COALESCE(new.department_id, 0), COALESCE(new.status, ''), 1)
+    ON CONFLICT (department_id, status) DO UPDATE SET n = n + excluded.n;
+  INSERT INTO stats_by_doctor (doctor_id, status, n) VALUES (COALESCE(new.doctor_id, 0), COALESCE(new.status, ''), 1)
+    ON CONFLICT (doctor_id, status) DO UPDATE SET n = n + excluded.n;
+END;
+CREATE TRIGGER IF NOT EXISTS appointments_stats_delete AFTER DELETE ON appointments BEGIN
+  INSERT INTO stats_daily (day, status, n) VALUES (substr(old.start_time, 1, 10), COALESCE(old.status, ''), -1)
+    ON CONFLICT (day, status) DO UPDATE SET n = n + excluded.n;
+  INSERT INTO stats_by_department (department_id, status, n) VALUES (COALESCE(old.department_id, 0), COALESCE(old.status, ''), -1)
+    ON CONFLICT (department_id, status) DO UPDATE SET n = n + excluded.n;
+  INSERT INTO stats_by_doctor (doctor_id, status, n) VALUES (COALESCE(old.doctor_id, 0), COALESCE(old.status, ''), -1)
+    ON CONFLICT (doctor_id, status) DO UPDATE SET n = n + excluded.n;
+END;
+CREATE TRIGGER IF NOT EXISTS patients_stats_insert AFTER INSERT ON patients BEGIN
+  INSERT INTO stats_totals (name, n) VALUES ('patients', 1) ON CONFLICT (name) DO UPDATE SET n = n + excluded.n;
+END;
+CREATE TRIGGER IF NOT EXISTS patients_stats_delete AFTER DELETE ON patients BEGIN
+  INSERT INTO stats_totals (name, n) VALUES ('patients', -1) ON CONFLICT (name) DO UPDATE SET n = n + excluded.n;
+END;
@@ -0,0 +1,268 @@
+"""Synthetic data generator for demo and load-testing databases.
+
+Usage:
+    python seed.py --patients 1000000 --appointments 5000000 [--db PATH]
+
+Faker is only used to build small pools of names, phone numbers and
+sentences up front; every row is then assembled from NumPy-sampled indexes
+into those pools and inserted with executemany in batched transactions.
+"""
+import argparse
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+import db
+
+DEFAULT_DEPARTMENTS = ("Cardiology", "Neurology", "Pediatrics", "Oncology", "Emergency")
+# Distinct Faker values generated per field; rows sample from these.
+POOL_SIZE = 1000
+BATCH_SIZE = 50_000
+DURATIONS_MIN = np.array([15, 30, 45, 60])
+# Appointments start on these boundaries within db.WORKDAY_START..WORKDAY_END.
+SLOT_MIN = 15
+STATUSES = np.array(["scheduled", "completed", "cancelled"], dtype=object)
+STATUS_WEIGHTS = [0.7, 0.2, 0.1]
+EMAIL_DOMAINS = np.array(["example.com", "example.org", "example.net", "mail.test"], dtype=object)
+
+
+def make_pools(size: int = POOL_SIZE, seed: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """Pre-generate Faker values once so per-row generation is just indexing."""
+    import faker
+
+    fake = faker.Faker()
+    if seed is not None:
+        fake.seed_instance(seed)
+    return {
+        "first_name": np.array([fake.first_name() for _ in range(size)], dtype=object),
+        "last_name": np.array([fake.last_name() for _ in range(size)], dtype=object),
+        "phone": np.array([fake.phone_number() for _ in range(size)], dtype=object),
+        "reason": np.array([fake.sentence(nb_words=6) for _ in range(size)], dtype=object),
+    }
+
+
+def _batches(total: int, batch_size: int) -> Iterator[int]:
+    for start in range(0, total, batch_size):
+        yield min(batch_size, total - start)
+
+
+def _insert_batched(conn: sqlite3.Connection, sql: str, total: int, batch_size: int, make_rows) -> None:
+    """Insert `total` rows, one transaction per batch of make_rows(n) rows."""
+    for n in _batches(total, batch_size):
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(sql, make_rows(n))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def _timestamps(rng: np.random.Generator, n: int, start: np.datetime64, minutes: int, step: int = 1) -> np.ndarray:
+    """n random datetime64[m] values in [start, start + minutes), aligned to `step` minutes."""
+    offsets = rng.integers(0, max(1, minutes // step), n) * step
+    return start + offsets.astype("timedelta64[m]")
+
+
+def _iso(values: np.ndarray, sep: str = "T") -> np.ndarray:
+    text = np.datetime_as_string(values, unit="s")
+    return np.char.replace(text, "T", sep) if sep != "T" else text
+
+
+def _emails(first: np.ndarray, last: np.ndarray, domains: np.ndarray, serial: Iterator[int]) -> list:
+    return [f"{f.lower()}.{l.lower()}{i}@{d}" for f, l, d, i in zip(first.tolist(), last.tolist(), domains.tolist(), serial)]
+
+
+def seed_departments(conn: sqlite3.Connection, names: Sequence[str] = DEFAULT_DEPARTMENTS) -> np.ndarray:
+    conn.execute("BEGIN")
+    conn.executemany("INSERT OR IGNORE INTO departments (name) VALUES (?)", ((n,) for n in names))
+    conn.execute("COMMIT")
+    return np.array([r[0] for r in conn.execute("SELECT id FROM departments")], dtype=np.int64)
+
+
+def seed_doctors(conn: sqlite3.Connection, rng: np.random.Generator, pools: Dict[str, np.ndarray], count: int, department_ids: np.ndarray, batch_size: int = BATCH_SIZE) -> None:
+    serial = iter(range(1, count + 1))
+
+    def rows(n):
+        first = rng.choice(pools["first_name"], n)
+        last = rng.choice(pools["last_name"], n)
+        email = _emails(first, last, np.full(n, "hospital.test", dtype=object), serial)
+        return zip(first.tolist(), last.tolist(), rng.choice(department_ids, n).tolist(), email)
+
+    _insert_batched(conn, "INSERT INTO doctors (first_name, last_name, department_id, email) VALUES (?, ?, ?, ?)", count, batch_size, rows)
+
+
+def seed_patients(conn: sqlite3.Connection, rng: np.random.Generator, pools: Dict[str, np.ndarray], count: int, batch_size: int = BATCH_SIZE) -> None:
+    serial = iter(range(1, count + 1))
+    today = np.datetime64("today", "D")
+    now = np.datetime64("now", "m")
+
+    def rows(n):
+        first = rng.choice(pools["first_name"], n)
+        last = rng.choice(pools["last_name"], n)
+        dob = np.datetime_as_string(today - rng.integers(0, 90 * 365, n).astype("timedelta64[D]"), unit="D")
+        gender = rng.choice(np.array(["Male", "Female"], dtype=object), n)
+        phone = rng.choice(pools["phone"], n)
+        email = _emails(first, last, rng.choice(EMAIL_DOMAINS, n), serial)
+        created = _iso(_timestamps(rng, n, now - np.timedelta64(5 * 365 * 24 * 60, "m"), 5 * 365 * 24 * 60), sep=" ")
+        return zip(first.tolist(), last.tolist(), dob.tolist(), gender.tolist(), phone.tolist(), email, created.tolist())
+
+    _insert_batched(
+        conn,
+        "INSERT INTO patients (first_name, last_name, dob, gender, phone, email, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        count, batch_size, rows,
+    )
+
+
+def _minutes(t) -> int:
+    return t.hour * 60 + t.minute
+
+
+def _doctor_bookings(rng: np.random.Generator, doctors: int, count: int, first_day: np.datetime64, days: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """`count` (doctor index, start, end) bookings that never overlap for the same doctor.
+
+    Starts are distinct working-hour SLOT_MIN slots per doctor, sampled
+    without replacement. Each duration comes from DURATIONS_MIN and is cut
+    short so it ends by the doctor's next booking and by WORKDAY_END.
+    """
+    opens, closes = _minutes(db.WORKDAY_START), _minutes(db.WORKDAY_END)
+    per_day = (closes - opens) // SLOT_MIN
+    slots = days * per_day
+    if count > doctors * slots:
+        raise ValueError(f"{count:,} appointments do not fit in the working hours of {doctors:,} doctors over {days} days")
+    picks = np.sort(rng.choice(doctors * slots, count, replace=False))
+    doctor, slot = np.divmod(picks, slots)
+    day, slot_of_day = np.divmod(slot, per_day)
+    room = per_day - slot_of_day
+    room[:-1] = np.where(doctor[1:] == doctor[:-1], np.minimum(room[:-1], slot[1:] - slot[:-1]), room[:-1])
+    start = first_day.astype("datetime64[m]") + (day * 24 * 60 + opens + slot_of_day * SLOT_MIN).astype("timedelta64[m]")
+    minutes = np.minimum(rng.choice(DURATIONS_MIN, count), room * SLOT_MIN)
+    # Insert in random order so ids are not grouped by doctor.
+    order = rng.permutation(count)
+    return doctor[order], start[order], (start + minutes.astype("timedelta64[m]"))[order]
+
+
+def seed_appointments(conn: sqlite3.Connection, rng: np.random.Generator, pools: Dict[str, np.ndarray], count: int, days_back: int = 30, days_ahead: int = 0, batch_size: int = BATCH_SIZE) -> None:
+    """Book `count` appointments over the window, none overlapping another of the same doctor."""
+    patient_ids = np.array([r[0] for r in conn.execute("SELECT id FROM patients")], dtype=np.int64)
+    doctors = np.array(conn.execute("SELECT id, COALESCE(department_id, 0) FROM doctors").fetchall(), dtype=np.int64).reshape(-1, 2)
+    if not len(patient_ids) or not len(doctors):
+        return
+    first_day = np.datetime64("today", "D") - np.timedelta64(days_back, "D")
+    doctor, start, end = _doctor_bookings(rng, len(doctors), count, first_day, max(1, days_back + days_ahead))
+    done = 0
+
+    def rows(n):
+        nonlocal done
+        doc = doctors[doctor[done:done + n]]
+        part = slice(done, done + n)
+        done += n
+        department = [d or None for d in doc[:, 1].tolist()]
+        return zip(
+            rng.choice(patient_ids, n).tolist(),
+            doc[:, 0].tolist(),
+            department,
+            _iso(start[part]).tolist(),
+            _iso(end[part]).tolist(),
+            rng.choice(STATUSES, n, p=STATUS_WEIGHTS).tolist(),
+            rng.choice(pools["reason"], n).tolist(),
+        )
+
+    _insert_batched(
+        conn,
+        "INSERT INTO appointments (patient_id, doctor_id, department_id, start_time, end_time, status, reason) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        count, batch_size, rows,
+    )
+
+
+SEEDED_TABLES = ("departments", "doctors", "patients", "appointments")
+
+
+@contextmanager
+def deferred_indexes(conn: sqlite3.Connection, tables: Sequence[str] = SEEDED_TABLES) -> Iterator[None]:
+    """Drop secondary indexes and triggers on `tables`, restoring them afterwards.
+
+    Building an index once over the loaded rows is far cheaper than
+    maintaining it row by row with random keys. Trigger side effects are
+    replayed once at the end: every table version is bumped and the
+    trigger-maintained tables are rebuilt.
+    """
+    marks = ", ".join("?" for _ in tables)
+    saved = conn.execute(
+        f"SELECT type, name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND sql IS NOT NULL AND tbl_name IN ({marks})",
+        tuple(tables),
+    ).fetchall()
+    for kind, name, _ in saved:
+        conn.execute(f'DROP {kind.upper()} IF EXISTS "{name}"')
+    try:
+        yield
+    finally:
+        conn.execute("BEGIN")
+        for _, _, sql in saved:
+            conn.execute(sql)
+        conn.execute(f"UPDATE table_versions SET version = version + 1 WHERE name IN ({marks})", tuple(tables))
+        conn.execute("COMMIT")
+        db.rebuild_derived()
+
+
+def generate(
+    conn: sqlite3.Connection,
+    doctors: int = 10,
+    patients: int = 20,
+    appointments: int = 30,
+    departments: Sequence[str] = DEFAULT_DEPARTMENTS,
+    days_back: int = 30,
+    days_ahead: int = 0,
+    batch_size: int = BATCH_SIZE,
+    seed: Optional[int] = None,
+) -> None:
+    """Append synthetic rows to the database behind `conn` (schema must exist)."""
+    rng = np.random.default_rng(seed)
+    pools = make_pools(min(POOL_SIZE, max(doctors, patients, appointments, 1)), seed)
+    department_ids = seed_departments(conn, departments)
+    seed_doctors(conn, rng, pools, doctors, department_ids, batch_size)
+    seed_patients(conn, rng, pools, patients, batch_size)
+    seed_appointments(conn, rng, pools, appointments, days_back, days_ahead, batch_size)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=db.DB_PATH, help="database file to create or extend")
+    parser.add_argument("--schema", default="schema.sql")
+    parser.add_argument("--doctors", type=int, default=200)
+    parser.add_argument("--patients", type=int, default=100_000)
+    parser.add_argument("--appointments", type=int, default=1_000_000)
+    parser.add_argument("--days-back", type=int, default=365)
+    parser.add_argument("--days-ahead", type=int, default=90)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    db.DB_PATH = args.db
+    db.migrate(args.schema)
+    conn = db.connect(args.db)
+    conn.execute("PRAGMA synchronous = OFF")
+    t0 = time.perf_counter()
+    with deferred_indexes(conn):
+        generate(
+            conn,
+            doctors=args.doctors,
+            patients=args.patients,
+            appointments=args.appointments,
+            days_back=args.days_back,
+            days_ahead=args.days_ahead,
+            batch_size=args.batch_size,
+            seed=args.seed,
+        )
+    conn.execute("ANALYZE")
+    conn.close()
+    total = args.doctors + args.patients + args.appointments
+    elapsed = time.perf_counter() - t0
+    print(f"Inserted {total:,} rows into {args.db} in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
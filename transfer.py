@@ -0,0 +1,144 @@
+"""Chunked CSV/Parquet import through the bulk db APIs, and streaming export.
+
+Files are parsed a chunk at a time (pandas read_csv chunksize / pyarrow
+iter_batches) and exports are written a fetchmany() chunk at a time, so
+memory stays proportional to the chunk size rather than the table size.
+"""
+import csv
+import io
+import math
+import os
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, TextIO, Union
+
+import db
+
+IMPORT_CHUNK_SIZE = 5000
+IMPORTERS = {
+    "patients": db.add_patients_bulk,
+    "appointments": db.add_appointments_bulk,
+}
+
+Records = List[Dict[str, Any]]
+
+
+def _clean(value: Any) -> Any:
+    """Map empty cells to None and timestamps to the ISO strings the app stores."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(source, chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[Records]:
+    import pandas as pd
+
+    for frame in pd.read_csv(source, chunksize=chunk_size, dtype=str, keep_default_na=False):
+        yield [{k: _clean(v) for k, v in rec.items()} for rec in frame.to_dict("records")]
+
+
+def iter_parquet(source, chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[Records]:
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+        yield [{k: _clean(v) for k, v in rec.items()} for rec in batch.to_pylist()]
+
+
+def iter_records(source, filename: str, chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[Records]:
+    name = filename.lower()
+    if name.endswith(".parquet"):
+        return iter_parquet(source, chunk_size)
+    if name.endswith(".csv"):
+        return iter_csv(source, chunk_size)
+    raise ValueError(f"Unsupported file type: {filename} (expected .csv or .parquet)")
+
+
+def import_file(
+    table: str,
+    source,
+    filename: str,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    on_chunk: Optional[Callable[[int, int, int], None]] = None,
+) -> db.BulkResult:
+    """Stream `source` into `table`, one bulk transaction per chunk.
+
+    Error indexes are 0-based data rows in the file. `on_chunk(rows seen,
+    rows inserted, errors)` is called after each chunk for progress display.
+    """
+    insert = IMPORTERS[table]
+    inserted, errors, seen = 0, [], 0
+    for chunk in iter_records(source, filename, chunk_size):
+        result = insert(chunk, start_index=seen)
+        inserted += result.inserted
+        errors.extend(result.errors)
+        seen += len(chunk)
+        if on_chunk:
+            on_chunk(seen, inserted, len(errors))
+    return db.BulkResult(inserted, errors)
+
+
+EXPORT_FORMATS = ("csv", "parquet")
+
+
+def export_csv(name: str, out: TextIO, chunk_size: int = db.EXPORT_CHUNK_SIZE) -> int:
+    """Write export `name` to a text stream as CSV; returns the row count."""
+    writer = csv.writer(out)
+    total = 0
+    header = False
+    for columns, rows in db.iter_export(name, chunk_size):
+        if not header:
+            writer.writerow(columns)
+            header = True
+        writer.writerows(rows)
+        total += len(rows)
+    return total
+
+
+def _arrow_type(declared: str):
+    """Arrow type for a column's declared SQLite type, following SQLite's affinity rules."""
+    import pyarrow as pa
+
+    declared = declared.upper()
+    if "INT" in declared:
+        return pa.int64()
+    if any(t in declared for t in ("REAL", "FLOA", "DOUB")):
+        return pa.float64()
+    if "BLOB" in declared:
+        return pa.binary()
+    # TEXT, and computed columns, which are all text in EXPORTS.
+    return pa.string()
+
+
+def export_parquet(name: str, path: Union[str, BinaryIO], chunk_size: int = db.EXPORT_CHUNK_SIZE) -> int:
+    """Write export `name` to a Parquet file or binary stream, one row group per chunk; returns the row count.
+
+    The schema comes from the declared column types rather than the
+    data, so a column that is NULL throughout one chunk keeps its type.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([pa.field(column, _arrow_type(declared)) for column, declared in db.export_columns(name)])
+    total = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for columns, rows in db.iter_export(name, chunk_size):
+            values = dict(zip(columns, map(list, zip(*rows))))
+            writer.write_table(pa.table(values, schema=schema))
+            total += len(rows)
+    return total
+
+
+def export_file(name: str, fmt: str, out: Union[str, BinaryIO], chunk_size: int = db.EXPORT_CHUNK_SIZE) -> int:
+    """Write export `name` as `fmt` to a path or a binary stream, which is left open; returns the row count."""
+    if fmt == "parquet":
+        return export_parquet(name, out, chunk_size)
+    if isinstance(out, (str, os.PathLike)):
+        with open(out, "w", newline="") as f:
+            return export_csv(name, f, chunk_size)
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    try:
+        return export_csv(name, text, chunk_size)
+    finally:
+        text.detach()  # flushes without closing `out`